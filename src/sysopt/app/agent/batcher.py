@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+
+class PromptBatcher:
+    """
+    Coalesces concurrent LLM requests and bounds how many reach the backend.
+
+    Requests that share a key while an identical request is already in flight
+    wait for that call instead of issuing their own. At most `max_in_flight`
+    distinct calls run against the backend at the same time; further callers
+    block until a slot is free.
+    """
+
+    def __init__(self, fn: Callable[..., Any], max_in_flight: int = 8):
+        """
+        Initialize the batcher.
+
+        Args:
+            fn (Callable): Function performing the actual backend call.
+            max_in_flight (int): Maximum number of concurrent backend calls.
+                Defaults to 8.
+        """
+        self._fn = fn
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, *args: Any) -> Any:
+        """
+        Run `fn(*args)`, or join an in-flight call with the same key.
+
+        Args:
+            key (str): Identity of the request (e.g. an LLMCache key).
+            *args: Arguments passed to `fn`.
+
+        Returns:
+            Any: The result of `fn`. Exceptions are re-raised for every caller.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            with self._slots:
+                result = self._fn(*args)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
@@ -0,0 +1,75 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import orjson
+
+
+class LLMCache:
+    """
+    A thread-safe LRU cache with a time-to-live for LLM responses.
+
+    Entries are keyed by a SHA-256 hash of model, mode and prompt, so only exact
+    repeats of a prompt are answered from the cache. Expired entries are dropped
+    lazily on lookup; the least recently used entry is evicted when full.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize (int): Maximum number of cached responses. Defaults to 1024.
+            ttl (float): Seconds a response stays valid. Defaults to 3600.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model: str, mode: str, prompt: str, options: Optional[dict] = None) -> str:
+        """
+        Build the cache key for a prompt.
+
+        Args:
+            model (str): Model or endpoint the prompt is sent to.
+            mode (str): Request mode (e.g. "query", "generate").
+            prompt (str): The prompt text.
+            options (dict, optional): Sampling options sent with the prompt (e.g. temperature).
+
+        Returns:
+            str: Hex SHA-256 digest identifying the request.
+        """
+        raw = orjson.dumps(
+            {"model": model, "mode": mode, "prompt": prompt, "options": options or {}},
+            option=orjson.OPT_SORT_KEYS
+        )
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return the cached response for `key`, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a response under `key`, evicting the oldest entry if the cache is full.
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
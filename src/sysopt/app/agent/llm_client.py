@@ -1,14 +1,24 @@
 import requests
-import os
-from dotenv import load_dotenv
+import logging
+import orjson
 from typing import Dict, Any
+from requests.adapters import HTTPAdapter
 
+from .cache import LLMCache
+from ..settings import SETTINGS
 
-load_dotenv()
 
-LLM_API_KEY = os.getenv("LLM_API_KEY")
-IP = os.getenv("IP")
+logger = logging.getLogger(__name__)
 
+LLM_API_KEY = SETTINGS.llm_api_key
+IP = SETTINGS.ip
+
+# Shared keep-alive pool: all LLMClient instances reuse the same connections
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=32))
+
+# Exact-match cache for stateless ("query" mode) prompts
+_CACHE = LLMCache(maxsize=1024, ttl=3600)
 
 
 class LLMClient:
@@ -35,6 +45,11 @@ class LLMClient:
         self.api_url = api_url or f"http://{IP}/api/v1/workspace/{workspace_slug}/chat"
         self.api_key = api_key or LLM_API_KEY
 
+        # Headers are constant per client, so build them once
+        auth = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        self._get_headers = {"accept": "application/json", **auth}
+        self._post_headers = {"Content-Type": "application/json", **auth}
+
     def get_workspace_chats(self, workspace_slug: str = "default") -> Dict[str, Any]:
         """
         Retrieve recent chats from a workspace.
@@ -46,31 +61,25 @@ class LLMClient:
         Returns:
             Dict[str, Any]: JSON response containing chats or error.
         """
-        headers = {"accept": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
-
+        headers = self._get_headers
         chats_url = f"http://{IP}/api/v1/workspace/{workspace_slug}/chats"
 
-        print(f"Fetching chats from: {chats_url}")
-        print(f"Headers: {headers}")
+        logger.debug("Fetching chats from: %s", chats_url)
 
         response = None  # <- Definiere `response` außerhalb des try-Blocks
 
         try:
-            response = requests.get(chats_url, headers=headers, timeout=30)
+            response = _SESSION.get(chats_url, headers=headers, timeout=30)
             response.raise_for_status()
 
-            # DEBUG: Print the raw response before parsing JSON
-            print("Raw response:", response.text[:500])  # Nur ersten 500 Zeichen
-            print("Status Code:", response.status_code)
-            print("Headers:", dict(response.headers))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Status %s, raw response: %.500s", response.status_code, response.text)
 
-            return response.json()
+            return orjson.loads(response.content)
         except requests.exceptions.HTTPError as e:
             status_code = getattr(response, 'status_code', 'N/A')
             return {"error": f"HTTP error occurred: {e}", "status_code": status_code}
-        except requests.exceptions.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             return {
                 "error": f"JSON decode error: {e}",
                 "raw_response": response.text if response else "No response object",
@@ -97,32 +106,30 @@ class LLMClient:
         Returns:
             Dict[str, Any]: JSON response from the API or an error dictionary.
         """
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
-
+        # Only "query" mode is stateless; "chat" answers depend on workspace history
+        cache_key = LLMCache.make_key(self.api_url, mode, prompt) if mode == "query" else None
+        if cache_key:
+            cached = _CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+
+        headers = self._post_headers
         payload = {"message": prompt, "mode": mode}
 
-        # print(f"Sending request to: {self.api_url}")  # <- DEBUG
-        # print(f"Headers: {headers}")                  # <- DEBUG
-        # print(f"Payload: {payload}")                  # <- DEBUG
-
         response = None  # <- Definiere `response` außerhalb des try-Blocks
 
         try:
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=300)
+            response = _SESSION.post(self.api_url, json=payload, headers=headers, timeout=300)
             response.raise_for_status()
 
-            # DEBUG: Print the raw response before parsing JSON
-            # print("Raw response:", response.text[:200])  # Nur ersten 200 Zeichen
-            # print("Status Code:", response.status_code)
-            # print("Headers:", dict(response.headers))
-
-            return response.json()
+            result = orjson.loads(response.content)
+            if cache_key:
+                _CACHE.set(cache_key, result)
+            return result
         except requests.exceptions.HTTPError as e:
             status_code = getattr(response, 'status_code', 'N/A')
             return {"error": f"HTTP error occurred: {e}", "status_code": status_code}
-        except requests.exceptions.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             return {
                 "error": f"JSON decode error: {e}",
                 "raw_response": response.text if response else "No response object",
@@ -7,9 +7,14 @@ API routes for AI Agent with Bottles integration.
 - New: bottles_folder_installer for copying host folders into bottles
 """
 
-import sys, shutil, time, os, subprocess, json, threading, tempfile, traceback, requests, re 
-from pathlib import Path
-from flask import Blueprint, jsonify, request, Response, stream_with_context, render_template
+import time, requests, re, socket
+import orjson
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from .settings import SETTINGS
 
 # Internal scanners
 from .scanner.ram_cpu import top_memory_processes
@@ -17,40 +22,113 @@ from .scanner.storage import find_largest_files
 from .scanner.autorun import list_systemd_enabled, list_user_autostart
 from .scanner.ports import scan_ports
 from .scanner.cve import check_package_cves
+from .agent.cache import LLMCache
+from .agent.batcher import PromptBatcher
+
+MCP_BASE_URL = SETTINGS.mcp_base_url
 
-MCP_SERVER_IP = os.getenv("MCP_SERVER_IP", "127.0.0.1")
-MCP_SERVER_PORT = os.getenv("MCP_SERVER_PORT", "8766")
-MCP_BASE_URL = f"http://{MCP_SERVER_IP}:{MCP_SERVER_PORT}"
+OLLAMA_MODEL = SETTINGS.ollama_model
+OLLAMA_GENERATE_URL = f"{SETTINGS.ollama_base_url}/api/generate"
+OLLAMA_CHAT_URL = f"{SETTINGS.ollama_base_url}/v1/chat/completions"
+JSON_HEADERS = {"Content-Type": "application/json"}
 
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "localhost")
-OLLAMA_PORT = os.getenv("OLLAMA_PORT", "11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+# Exact-match cache for /agent/prompt answers
+PROMPT_CACHE = LLMCache(maxsize=1024, ttl=3600)
 
 api_routes = Blueprint('api', __name__)
 
+# ------------------------------------------------------------------
+# HTTP Session
+# ------------------------------------------------------------------
+# One keep-alive pool shared by all Ollama/MCP calls, so each worker thread
+# reuses an open TCP connection instead of reconnecting per request.
+
+# Bytes read from a streamed response per call. The socket receive buffer is left
+# to the kernel: setting SO_RCVBUF turns off TCP receive autotuning on Linux
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class StreamingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter for the Ollama connection: TCP_NODELAY, so small token chunks
+    of long streams are not held back.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=100))
+# Longest prefix wins, so every Ollama request uses the streaming-tuned pool
+HTTP_SESSION.mount(f"{SETTINGS.ollama_base_url}/", StreamingAdapter(pool_connections=1, pool_maxsize=100))
+
 # ------------------------------------------------------------------
 # Utility
 # ------------------------------------------------------------------
+def _sse(payload: dict) -> bytes:
+    """Encodes one stream line in the ' {json}\\n' format the agent UI reads."""
+    return b" " + orjson.dumps(payload) + b"\n"
+
+def _iter_stream_lines(resp, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Yields the raw lines (bytes, without CR/LF) of a streamed response.
+    Splits a bytearray buffer manually instead of using iter_lines().
+    """
+    buf = bytearray()
+    for chunk in resp.iter_content(chunk_size):
+        buf.extend(chunk)
+        start = 0
+        while (nl := buf.find(b"\n", start)) != -1:
+            yield bytes(buf[start:nl]).rstrip(b"\r")
+            start = nl + 1
+        del buf[:start]
+    if buf:
+        yield bytes(buf).rstrip(b"\r")
+
+BOTTLE_MENTION_REGEX = re.compile(r"bottle\s*['\"]?([a-zA-Z0-9_\-]{2,32})['\"]?", re.IGNORECASE)
+TOOL_CALL_REGEX = re.compile(r'\{"type":"function","function":\{.*?\}\}')
+
 def extract_bottle_name_from_response(response_text: str) -> str | None:
-    match = re.search(r"bottle\s*['\"]?([a-zA-Z0-9_\-]{2,32})['\"]?", response_text, re.IGNORECASE)
+    match = BOTTLE_MENTION_REGEX.search(response_text)
     return match.group(1) if match else None
 
 # ------------------------------------------------------------------
 # Ollama Endpoints 
 # ------------------------------------------------------------------
+def _ollama_generate(prompt: str, options: dict | None = None) -> str:
+    payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False}
+    if options:
+        payload["options"] = options
+    r = HTTP_SESSION.post(OLLAMA_GENERATE_URL, json=payload, headers=JSON_HEADERS, timeout=600)
+    r.raise_for_status()
+    return orjson.loads(r.content).get("response", "").strip()
+
+# Identical prompts arriving while one is in flight share its Ollama call
+PROMPT_BATCHER = PromptBatcher(_ollama_generate, max_in_flight=8)
+
 @api_routes.route('/agent/prompt', methods=['POST'])
 def agent_prompt():
     data = request.get_json()
     prompt = data.get('prompt')
     if not prompt:
         return jsonify({"error": "prompt required"}), 400
+    options = data.get('options')
+    if options is not None and not isinstance(options, dict):
+        return jsonify({"error": "options must be an object"}), 400
+    cache_key = LLMCache.make_key(OLLAMA_MODEL, "generate", prompt, options)
+    # Sampled answers differ per call; only greedy decoding requested by the caller is cached
+    cacheable = bool(options) and options.get("temperature") == 0
+    if cacheable:
+        cached = PROMPT_CACHE.get(cache_key)
+        if cached is not None:
+            return jsonify({"response": cached})
     try:
-        url = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/api/generate"
-        payload = {"model": OLLAMA_MODEL, "prompt": prompt, "stream": False}
-        r = requests.post(url, json=payload, headers={"Content-Type": "application/json"}, timeout=600)
-        r.raise_for_status()
-        answer = r.json().get("response", "")
-        return jsonify({"response": answer.strip()})
+        answer = PROMPT_BATCHER.submit(cache_key, prompt, options)
+        if cacheable:
+            PROMPT_CACHE.set(cache_key, answer)
+        return jsonify({"response": answer})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -60,7 +138,6 @@ def stream_prompt_ollama():
     prompt = data.get('prompt')
     if not prompt:
         return jsonify({"error": "prompt required"}), 400
-    url = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1/chat/completions"
     payload = {
         "model": OLLAMA_MODEL,
         "messages": [{"role": "user", "content": prompt}],
@@ -68,25 +145,30 @@ def stream_prompt_ollama():
     }
     def generate():
         try:
-            with requests.post(url, json=payload, stream=True, timeout=1200) as r:
+            # Routed through StreamingAdapter (TCP_NODELAY)
+            with HTTP_SESSION.post(OLLAMA_CHAT_URL, json=payload, stream=True, timeout=1200) as r:
                 if r.status_code != 200:
-                    yield f" {json.dumps({'error': f'Ollama request failed: {r.status_code}'})}\n"
+                    yield _sse({'error': f'Ollama request failed: {r.status_code}'})
                     return
-                for line in r.iter_lines():
+                for line in _iter_stream_lines(r):
                     if line and line.startswith(b' '):
-                        yield line.decode('utf-8') + "\n"
+                        yield line + b"\n"
         except Exception as e:
-            yield f" {json.dumps({'error': f'Ollama stream error: {str(e)}'})}\n"
+            yield _sse({'error': f'Ollama stream error: {str(e)}'})
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
 
 # ------------------------------------------------------------------
 # System Scanners 
 # ------------------------------------------------------------------
+# Heavy scans run on a shared, bounded pool so concurrent requests cannot
+# start an unlimited number of /proc walks, file-tree walks or port sweeps.
+SCAN_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
 @api_routes.route('/scan/ram')
 def scan_ram():
     try:
         n = max(1, min(int(request.args.get('n', 10)), 50))
-        return jsonify(top_memory_processes(n))
+        return jsonify(SCAN_EXECUTOR.submit(top_memory_processes, n).result())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -95,7 +177,7 @@ def scan_storage():
     try:
         start_path = request.args.get('start_path')
         max_files = max(1, min(int(request.args.get('max_files', 25)), 500))
-        files = find_largest_files(start_path=start_path, max_files=max_files)
+        files = SCAN_EXECUTOR.submit(find_largest_files, start_path=start_path, max_files=max_files).result()
         return jsonify([{"size": s, "path": p} for s, p in files])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -115,7 +197,9 @@ def scan_ports_api():
     try:
         host = request.args.get('host', '127.0.0.1')
         max_port = max(1, min(int(request.args.get('max_port', 1024)), 65535))
-        result = scan_ports(host, ports=list(range(1, max_port + 1)))
+        result = SCAN_EXECUTOR.submit(
+            scan_ports, host, ports=range(1, max_port + 1), syn_scan=SETTINGS.syn_scan
+        ).result()
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -134,27 +218,27 @@ def scan_cve():
 # ------------------------------------------------------------------
 # MCP Proxies
 # ------------------------------------------------------------------
-BOTTLE_NAME_REGEX = r"^[a-zA-Z0-9_\- \.']{2,32}$"
+BOTTLE_NAME_REGEX = re.compile(r"^[a-zA-Z0-9_\- \.']{2,32}$")
 
 @api_routes.route('/agent/status/<bottle_name>')
 def agent_status(bottle_name):
-    if not re.match(BOTTLE_NAME_REGEX, bottle_name):
+    if not BOTTLE_NAME_REGEX.match(bottle_name):
         return jsonify({"error": "Invalid bottle name"}), 400
     try:
-        resp = requests.get(f"{MCP_BASE_URL}/status/{bottle_name}", timeout=5)
+        resp = HTTP_SESSION.get(f"{MCP_BASE_URL}/status/{bottle_name}", timeout=5)
         if resp.status_code == 200:
-            return jsonify(resp.json())
+            return jsonify(orjson.loads(resp.content))
         return jsonify({"error": f"MCP returned {resp.status_code}"}), resp.status_code
     except Exception as e:
         return jsonify({"error": f"Status check failed: {str(e)}"}), 500
 
 @api_routes.route('/agent/candidates/<bottle_name>')
 def agent_candidates(bottle_name):
-    if not re.match(BOTTLE_NAME_REGEX, bottle_name):
+    if not BOTTLE_NAME_REGEX.match(bottle_name):
         return jsonify({"error": "Invalid bottle name"}), 400
     try:
-        resp = requests.get(f"{MCP_BASE_URL}/candidates/{bottle_name}", timeout=10)
-        return jsonify(resp.json())
+        resp = HTTP_SESSION.get(f"{MCP_BASE_URL}/candidates/{bottle_name}", timeout=10)
+        return jsonify(orjson.loads(resp.content))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -166,8 +250,8 @@ def agent_choose_exe():
         exe_path = data.get('exe_path')
         if not bottle or not exe_path:
             return jsonify({"error": "Missing bottle or exe_path"}), 400
-        resp = requests.post(f"{MCP_BASE_URL}/agent/choose_exe", json=data, timeout=10)
-        return jsonify(resp.json())
+        resp = HTTP_SESSION.post(f"{MCP_BASE_URL}/agent/choose_exe", json=data, timeout=10)
+        return jsonify(orjson.loads(resp.content))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -178,6 +262,19 @@ def agent_choose_exe():
 # ------------------------------------------------------------------
 # LLM + MCP Streaming Workflow 
 # ------------------------------------------------------------------
+# Bounds the number of concurrent MCP tool calls across all streams
+MCP_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+def _call_mcp(mcp_payload: dict) -> dict:
+    """Posts one JSON-RPC tool call to the MCP server and returns the log entry for the stream."""
+    try:
+        mcp_resp = HTTP_SESSION.post(MCP_BASE_URL, json=mcp_payload, timeout=10)
+        if mcp_resp.status_code == 200:
+            return {'log': f'[MCP] Result: {orjson.loads(mcp_resp.content)}'}
+        return {'log': f'[MCP] Error: {mcp_resp.status_code}'}
+    except Exception as e:
+        return {'log': f'[MCP] Connection error: {e}'}
+
 @api_routes.route('/agent/llm_mcp_stream', methods=['POST'])
 def agent_llm_mcp_stream():
     data = request.get_json()
@@ -224,7 +321,6 @@ def agent_llm_mcp_stream():
         }
     ]
 
-    ollama_url = f"http://{OLLAMA_HOST}:{OLLAMA_PORT}/v1/chat/completions"
     ollama_payload = {
         "model": OLLAMA_MODEL,
         "messages": [{"role": "user", "content": ollama_prompt}],
@@ -234,48 +330,58 @@ def agent_llm_mcp_stream():
     }
 
     def generate():
+        # MCP calls run on MCP_EXECUTOR so reading Ollama tokens never waits on MCP;
+        # results are yielded as soon as they are done.
+        pending = set()
+
+        def submit_tool_call(params: dict, id_prefix: str):
+            mcp_payload = {
+                "jsonrpc": "2.0",
+                "method": "tools/call",
+                "params": params,
+                "id": f"{id_prefix}_{int(time.time())}"
+            }
+            pending.add(MCP_EXECUTOR.submit(_call_mcp, mcp_payload))
+
+        def finished_results(block: bool = False):
+            done, _ = wait(pending, timeout=None if block else 0)
+            for future in done:
+                pending.discard(future)
+                yield _sse(future.result())
+
         try:
-            with requests.post(ollama_url, json=ollama_payload, stream=True, timeout=1200) as ollama_resp:
+            # Routed through StreamingAdapter (TCP_NODELAY)
+            with HTTP_SESSION.post(OLLAMA_CHAT_URL, json=ollama_payload, stream=True, timeout=1200) as ollama_resp:
                 if ollama_resp.status_code != 200:
-                    yield f" {json.dumps({'log': f'Ollama error: {ollama_resp.status_code}'})}\n"
+                    yield _sse({'log': f'Ollama error: {ollama_resp.status_code}'})
                     return
 
-                for line in ollama_resp.iter_lines():
+                for line in _iter_stream_lines(ollama_resp):
+                    if pending:
+                        yield from finished_results()
                     if not line:
                         continue
                     try:
-                        decoded = line.decode('utf-8')
-                        if decoded.startswith('data: '):
-                            json_part = decoded[6:].strip()
-                            if json_part in ('', '[DONE]'):
+                        if line.startswith(b'data: '):
+                            json_part = line[6:].strip()
+                            if json_part in (b'', b'[DONE]'):
+                                continue
+                            # Plain text deltas are never forwarded, only tool calls are.
+                            # Both tool-call forms contain "function", so skip parsing the rest.
+                            if b'function' not in json_part:
                                 continue
 
-                            data = json.loads(json_part)
+                            data = orjson.loads(json_part)
                             delta = data.get('choices', [{}])[0].get('delta', {})
-                            finish_reason = data.get('choices', [{}])[0].get('finish_reason')
 
                             # Handle tool call in 'content' 
                             content = delta.get('content', '')
                             if '"function":' in content or '"type":"function"' in content:
-                                match = re.search(r'\{"type":"function","function":\{.*?\}\}', content)
+                                match = TOOL_CALL_REGEX.search(content)
                                 if match:
-                                    func_data = json.loads(match.group(0))["function"]
-                                    yield f" {json.dumps({'log': f'[LLM] Tool call detected: {func_data}'})}\n"
-                                    mcp_payload = {
-                                        "jsonrpc": "2.0",
-                                        "method": "tools/call",
-                                        "params": func_data,
-                                        "id": f"toolcall_{int(time.time())}"
-                                    }
-                                    try:
-                                        mcp_resp = requests.post(MCP_BASE_URL, json=mcp_payload, timeout=10)
-                                        if mcp_resp.status_code == 200:
-                                            result = mcp_resp.json()
-                                            yield f" {json.dumps({'log': f'[MCP] Result: {result}'})}\n"
-                                        else:
-                                            yield f" {json.dumps({'log': f'[MCP] Error: {mcp_resp.status_code}'})}\n"
-                                    except Exception as e2:
-                                        yield f" {json.dumps({'log': f'[MCP] Connection error: {e2}'})}\n"
+                                    func_data = orjson.loads(match.group(0))["function"]
+                                    yield _sse({'log': f'[LLM] Tool call detected: {func_data}'})
+                                    submit_tool_call(func_data, "toolcall")
 
                             # Handle legacy 'tool_calls' delta
                             elif 'tool_calls' in delta:
@@ -283,26 +389,22 @@ def agent_llm_mcp_stream():
                                     func = tc.get('function', {})
                                     if 'name' in func and 'arguments' in func:
                                         try:
-                                            args = json.loads(func.get('arguments', '{}'))
+                                            args = orjson.loads(func.get('arguments', '{}'))
                                             tool_call = {"name": func['name'], "arguments": args}
-                                            yield f" {json.dumps({'log': f'[LLM] Legacy tool call: {tool_call}'})}\n"
-                                            mcp_payload = {
-                                                "jsonrpc": "2.0",
-                                                "method": "tools/call",
-                                                "params": tool_call,
-                                                "id": f"legacy_{int(time.time())}"
-                                            }
-                                            mcp_resp = requests.post(MCP_BASE_URL, json=mcp_payload, timeout=10)
-                                            if mcp_resp.status_code == 200:
-                                                yield f" {json.dumps({'log': f'[MCP] Result: {mcp_resp.json()}'})}\n"
+                                            yield _sse({'log': f'[LLM] Legacy tool call: {tool_call}'})
+                                            submit_tool_call(tool_call, "legacy")
                                         except Exception as e3:
-                                            yield f" {json.dumps({'log': f'[LLM] Parse error: {e3}'})}\n"
+                                            yield _sse({'log': f'[LLM] Parse error: {e3}'})
 
                     except Exception as e_inner:
-                        yield f" {json.dumps({'log': f'[Stream error]: {e_inner}'})}\n"
+                        yield _sse({'log': f'[Stream error]: {e_inner}'})
                         continue
 
+                # Stream finished: wait for tool calls that are still in flight
+                while pending:
+                    yield from finished_results(block=True)
+
         except Exception as e_outer:
-            yield f" {json.dumps({'log': f'[Critical error]: {e_outer}'})}\n"
+            yield _sse({'log': f'[Critical error]: {e_outer}'})
 
     return Response(stream_with_context(generate()), mimetype="text/event-stream")
@@ -1,34 +1,55 @@
-from flask import Flask, jsonify, render_template, request, send_from_directory, Response
+from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from dotenv import load_dotenv
+import orjson
 import os
+import signal
 import sys
-import json
-import shutil
 import threading
 import time
 import subprocess
-from pathlib import Path
 
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# Load .env once at the entry point, before app modules snapshot the environment
+load_dotenv()
+
+from .settings import SETTINGS
 from .api import api_routes
-from .scanner.ram_cpu import top_memory_processes
-from .scanner.storage import find_largest_files
-from .scanner.autorun import list_systemd_enabled, list_user_autostart
-from .scanner.ports import scan_ports
-from .scanner.cve import check_package_cves
-from .agent.llm_client import LLMClient
 
 template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'webui', 'templates')
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'webui', 'static')
 
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster (de)serialization of API responses."""
+
+    def _dumpb(self, obj) -> bytes:
+        # OPT_NON_STR_KEYS: /scan/ports returns a dict keyed by int port numbers
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumpb(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # jsonify(): pass orjson's bytes straight through instead of decoding to str
+        # and letting the response encode it again (large /scan/* payloads)
+        if args and kwargs:
+            raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+        # Same rules as jsonify(): one argument as-is, several as a list, otherwise kwargs
+        obj = args[0] if len(args) == 1 else list(args) if args else kwargs
+        return self._app.response_class(self._dumpb(obj) + b"\n", mimetype=self.mimetype)
+
 app = Flask(__name__,
            template_folder=template_dir,
            static_folder=static_dir)
+app.json = OrjsonProvider(app)
 
-CORS(app)  # Enable CORS for API calls
-
+# Enable CORS for API calls (a single registration, one after_request hook)
 CORS(app, resources={
     r"/api/*": {"origins": "*"},
     r"/api/agent/stream_prompt": {
@@ -50,13 +71,13 @@ ENV_FILE_PATH = os.path.abspath(".env")
 def setup_page():
     """Render setup page with current env values."""
     current = {
-        "PREFIX": os.getenv("PREFIX", ""),
-        "OLLAMA_HOST": os.getenv("OLLAMA_HOST", "localhost"),
-        "OLLAMA_PORT": os.getenv("OLLAMA_PORT", "11434"),
-        "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL", "llama3.2"),
-        "MCP_SERVER_IP": os.getenv("MCP_SERVER_IP", "127.0.0.1"),
-        "MCP_SERVER_PORT": os.getenv("MCP_SERVER_PORT", "8766"),
-        "WEBUI_PORT": os.getenv("WEBUI_PORT", "8000"),
+        "PREFIX": SETTINGS.prefix,
+        "OLLAMA_HOST": SETTINGS.ollama_host,
+        "OLLAMA_PORT": SETTINGS.ollama_port,
+        "OLLAMA_MODEL": SETTINGS.ollama_model,
+        "MCP_SERVER_IP": SETTINGS.mcp_server_ip,
+        "MCP_SERVER_PORT": SETTINGS.mcp_server_port,
+        "WEBUI_PORT": SETTINGS.webui_port,
     }
     return render_template("setup.html", config=current)
 
@@ -86,13 +107,22 @@ def save_config_and_start():
             f.write(f'MCP_SERVER_IP={data["MCP_SERVER_IP"]}\n')
             f.write(f'MCP_SERVER_PORT={data["MCP_SERVER_PORT"]}\n')
             f.write(f'WEBUI_PORT={data["WEBUI_PORT"]}\n')
+            if SETTINGS.syn_scan:
+                # Not part of the setup form; keep the opt-in across saves
+                f.write('SYN_SCAN=1\n')
 
         # Trigger restart
         def _restart():
             time.sleep(0.5)
+            if os.environ.get('SYSOPT_GUNICORN'):
+                # Let the gunicorn master reload its config and replace the workers
+                os.kill(os.getppid(), signal.SIGHUP)
+                return
             subprocess.Popen([sys.executable, '-m', 'app.main'] + sys.argv[2:])
             os._exit(0)
 
+        # After a short delay, so this response still reaches the client
+        threading.Thread(target=_restart, daemon=True).start()
 
         return jsonify({
             "message": "Configuration saved. Application is restarting..."
@@ -153,4 +183,6 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
+    # Development server only; use gunicorn (see gunicorn_conf.py) in production.
+    # Set FLASK_DEBUG=1 to enable the debugger and reloader.
+    app.run(host='0.0.0.0', port=int(SETTINGS.webui_port), threaded=True)
\ No newline at end of file
@@ -1,6 +1,5 @@
 import subprocess  # run commands on the computer
 import os          
-import glob        # search for files
 from typing import List  
 
 def list_systemd_enabled():
@@ -11,26 +10,29 @@ def list_systemd_enabled():
     
     try:
         # subprocess.check_output executes a command and returns the result
-        # systemctl list-unit-files --type=service --state=enabled
+        # systemctl list-unit-files --type=service --state=enabled --no-legend --plain
         # This is a command that you would normally type in the command line
         # It lists all services that are turned on (enabled)
-        command = ["systemctl", "list-unit-files", "--type=service", "--state=enabled"]
+        # --no-legend and --plain drop the header, footer and tree drawing,
+        # so every line is a unit
+        command = ["systemctl", "list-unit-files", "--type=service", "--state=enabled",
+                   "--no-legend", "--plain"]
         output = subprocess.check_output(command, text=True)
         
         # The output looks like this:
-        # ssh.service                     enabled
-        # docker.service                  enabled
-        # apache2.service                 enabled
+        # ssh.service                     enabled         enabled
+        # docker.service                  enabled         enabled
+        # apache2.service                 enabled         enabled
         # ...
         
-        lines = output.splitlines()
         services = []
         
-        for line in lines:
+        for line in output.splitlines():
             if ".service" in line:
-                words = line.split()
-                if len(words) > 0:  
-                    services.append(words[0])
+                # Only the first column (the unit name) is needed
+                name = line.split(None, 1)[0]
+                if name.endswith(".service"):
+                    services.append(name)
 
         return services
         
@@ -47,15 +49,16 @@ def list_user_autostart():
     
     autostart_folder = os.path.expanduser("~/.config/autostart")
 
-    desktop_files = glob.glob(os.path.join(autostart_folder, "*.desktop"))
-    
-    autostart_programs = []
-    
-    for file in desktop_files:
-        filename = os.path.basename(file) # only file name no .ending
-        autostart_programs.append(filename)
-    
-    return autostart_programs
+    # entry.name is already the file name, no path joining or glob pattern needed
+    try:
+        with os.scandir(autostart_folder) as entries:
+            # Hidden files are skipped, like the "*.desktop" glob did
+            return [entry.name for entry in entries
+                    if entry.name.endswith(".desktop") and not entry.name.startswith(".")
+                    and entry.is_file()]
+    except OSError:
+        # No (readable) autostart folder means no autostart programs
+        return []
 
 if __name__ == "__main__":
     print("System services that are turned on:")
@@ -0,0 +1,79 @@
+import hashlib
+import math
+import mmap
+import struct
+
+# On-disk header: number of bits, number of hash functions
+_HEADER = struct.Struct("<QI")
+
+
+class BloomFilter:
+    """
+    A compact set membership test with false positives but no false negatives.
+
+    `name in bloom` is False only if the name was never added; a True answer may
+    be wrong with probability `error_rate`. Positions are derived from a single
+    BLAKE2b digest via double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Initialize an empty filter.
+
+        Args:
+            capacity (int): Expected number of items.
+            error_rate (float): Target false-positive rate at `capacity` items.
+                Defaults to 0.01.
+        """
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def save(self, path: str) -> None:
+        """
+        Write the filter to `path`.
+        """
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(self.num_bits, self.num_hashes))
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        """
+        Map a filter written by `save` into memory.
+
+        The file is mmap'ed read-only, so loading costs no copy and only the pages
+        touched by lookups are read; repeated runs share them via the page cache.
+        A loaded filter cannot be added to.
+
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If the file is empty or truncated.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < _HEADER.size:
+            mapped.close()
+            raise ValueError(f"Truncated bloom filter: {path}")
+        bloom = cls.__new__(cls)
+        bloom.num_bits, bloom.num_hashes = _HEADER.unpack_from(mapped)
+        if len(mapped) - _HEADER.size < (bloom.num_bits + 7) // 8:
+            mapped.close()
+            raise ValueError(f"Truncated bloom filter: {path}")
+        bloom.bits = memoryview(mapped)[_HEADER.size:]
+        return bloom
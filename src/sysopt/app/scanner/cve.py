@@ -1,36 +1,395 @@
+import os
 import platform
+import sqlite3
 import subprocess
+import threading
 import json
-from typing import List, Dict
+import orjson
+import time
+import zipfile
+import zlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Optional
+
+from .bloom import BloomFilter
 
 OSV_API = "https://api.osv.dev/v1/query"
+OSV_BATCH_API = "https://api.osv.dev/v1/querybatch"
+OSV_VULN_API = "https://api.osv.dev/v1/vulns/{}"
+# OSV accepts at most 1000 queries per querybatch request
+OSV_BATCH_SIZE = 1000
+# Concurrent OSV requests while fetching vulnerability records
+OSV_WORKERS = 32
 
-def check_package_cves(name: str, version: str) -> List[Dict]:
+@dataclass(slots=True, frozen=True)
+class Package:
+    """An installed package as reported by the system package manager."""
+    name: str
+    version: str
+
+# One keep-alive session for all OSV traffic, so TLS is negotiated once per connection
+# and reused across queries and scans. OSV queries are read-only, so POSTs are
+# retried as well.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=OSV_WORKERS,
+    pool_maxsize=OSV_WORKERS,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+    ),
+))
+
+# Results per (name, version); an empty list is cached too ("no known vulns")
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "sysopt", "cve.sqlite")
+CACHE_TTL = 24 * 3600
+
+DPKG_STATUS_PATH = "/var/lib/dpkg/status"
+PACMAN_LOCAL_DIR = "/var/lib/pacman/local"
+
+# Package names that appear in OSV for the local distribution, used to skip queries
+# that cannot match. Distributions without an OSV ecosystem are queried unfiltered.
+OSV_ECOSYSTEMS = {"debian": "Debian", "ubuntu": "Ubuntu", "almalinux": "AlmaLinux", "rocky": "Rocky Linux"}
+OSV_ECOSYSTEM_ZIP = "https://osv-vulnerabilities.storage.googleapis.com/{}/all.zip"
+NAME_FILTER_PATH = os.path.join(os.path.dirname(CACHE_PATH), "osv_names-{}.bloom")
+NAME_FILTER_TTL = 7 * 24 * 3600
+
+# Installed package list, reused while the package database is unchanged
+PACKAGE_CACHE_PATH = os.path.join(os.path.dirname(CACHE_PATH), "packages.json")
+
+# ------------------------------------------------------------------
+# Result cache
+# ------------------------------------------------------------------
+# One connection for the whole process, set up on first use. sqlite3 connections
+# are not thread-safe by themselves, so every statement runs under _CACHE_LOCK.
+_CACHE_CONN: Optional[sqlite3.Connection] = None
+_CACHE_LOCK = threading.Lock()
+
+def _open_cache() -> Optional[sqlite3.Connection]:
+    """
+    Returns the shared CVE cache connection, opening (and creating) it on first use.
+
+    Returns:
+        Optional[sqlite3.Connection]: The connection, or None if the cache is unusable.
+    """
+    global _CACHE_CONN
+    with _CACHE_LOCK:
+        if _CACHE_CONN is not None:
+            return _CACHE_CONN
+        try:
+            os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+            conn = sqlite3.connect(CACHE_PATH, timeout=5, check_same_thread=False)
+            # WAL lets other processes read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cve_cache ("
+                "name TEXT, version TEXT, fetched_at INTEGER, payload BLOB, "
+                "PRIMARY KEY(name, version))"
+            )
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: CVE cache unavailable: {e}")
+            return None
+        _CACHE_CONN = conn
+        return conn
+
+def _cache_load(conn: sqlite3.Connection) -> Dict[tuple, List[Dict]]:
+    """Returns all fresh cache entries as {(name, version): vulns}."""
+    try:
+        with _CACHE_LOCK:
+            rows = conn.execute(
+                "SELECT name, version, payload FROM cve_cache WHERE fetched_at > ?",
+                (int(time.time()) - CACHE_TTL,),
+            ).fetchall()
+        return {(name, version): json.loads(zlib.decompress(payload)) for name, version, payload in rows}
+    except (sqlite3.Error, zlib.error, ValueError):
+        return {}
+
+def _cache_get(conn: sqlite3.Connection, name: str, version: str) -> Optional[List[Dict]]:
+    """Returns the fresh cache entry for one package, or None if there is none."""
+    with _CACHE_LOCK:
+        row = conn.execute(
+            "SELECT payload FROM cve_cache WHERE name = ? AND version = ? AND fetched_at > ?",
+            (name, version, int(time.time()) - CACHE_TTL),
+        ).fetchone()
+    return json.loads(zlib.decompress(row[0])) if row else None
+
+def _cache_store(conn: sqlite3.Connection, entries: List[tuple]) -> None:
+    """Stores (name, version, vulns) tuples."""
+    now = int(time.time())
+    try:
+        with _CACHE_LOCK, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cve_cache (name, version, fetched_at, payload) VALUES (?, ?, ?, ?)",
+                [(name, version, now, zlib.compress(json.dumps(vulns).encode())) for name, version, vulns in entries],
+            )
+    except sqlite3.Error as e:
+        print(f"Warning: Could not write CVE cache: {e}")
+
+# ------------------------------------------------------------------
+# OSV name prefilter
+# ------------------------------------------------------------------
+def _osv_ecosystem() -> Optional[str]:
+    """Returns the OSV ecosystem of the running distribution, if OSV has one."""
+    try:
+        return OSV_ECOSYSTEMS.get(platform.freedesktop_os_release().get("ID", ""))
+    except OSError:
+        return None
+
+def _build_name_filter(ecosystem: str, path: str) -> Optional[BloomFilter]:
+    """
+    Downloads the OSV dump of `ecosystem` and stores a Bloom filter of all affected
+    package names at `path`.
+
+    Returns:
+        Optional[BloomFilter]: The new filter, or None if the download failed.
+    """
+    tmp_zip = path + ".zip.part"
+    names = set()
+    print(f"Building OSV package name filter for {ecosystem}...")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _SESSION.get(OSV_ECOSYSTEM_ZIP.format(ecosystem), stream=True, timeout=60) as r:
+            r.raise_for_status()
+            with open(tmp_zip, "wb") as f:
+                for chunk in r.iter_content(1 << 20):
+                    f.write(chunk)
+
+        with zipfile.ZipFile(tmp_zip) as archive:
+            for info in archive.infolist():
+                if not info.filename.endswith(".json"):
+                    continue
+                record = json.loads(archive.read(info))
+                for affected in record.get("affected", []):
+                    name = affected.get("package", {}).get("name")
+                    if name:
+                        names.add(name)
+    except (requests.RequestException, OSError, zipfile.BadZipFile, ValueError) as e:
+        print(f"Warning: Could not build OSV name filter: {e}")
+        return None
+    finally:
+        if os.path.exists(tmp_zip):
+            os.remove(tmp_zip)
+
+    bloom = BloomFilter(capacity=len(names), error_rate=0.01)
+    for name in names:
+        bloom.add(name)
+    try:
+        bloom.save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Warning: Could not save OSV name filter: {e}")
+    return bloom
+
+def _name_filter(build: bool = False) -> Optional[BloomFilter]:
+    """
+    Returns the OSV package name filter for this distribution.
+
+    With build=True, a missing or week-old filter is rebuilt first; otherwise
+    only an existing filter is used. Returns None if no filter is available.
+    """
+    ecosystem = _osv_ecosystem()
+    if ecosystem is None:
+        return None
+    path = NAME_FILTER_PATH.format(ecosystem.replace(" ", "_"))
+
+    try:
+        fresh = time.time() - os.path.getmtime(path) < NAME_FILTER_TTL
+    except OSError:
+        fresh = False
+    if not fresh and build:
+        bloom = _build_name_filter(ecosystem, path)
+        if bloom is not None:
+            return bloom
+
+    # Fall back to a stale filter rather than none at all
+    try:
+        return BloomFilter.load(path)
+    except (OSError, ValueError):
+        return None
+
+# ------------------------------------------------------------------
+# OSV queries
+# ------------------------------------------------------------------
+def _query_package(name: str, version: str) -> Optional[List[Dict]]:
+    """Single-package OSV query. Returns None if the request failed."""
     payload = {"package": {"name": name}, "version": version}
     try:
-        r = requests.post(OSV_API, json=payload, timeout=10)
+        r = _SESSION.post(OSV_API, json=payload, timeout=10)
         if r.status_code == 200:
             return r.json().get("vulns", [])
     except Exception:
         pass
-    return []
+    return None
+
+def check_package_cves(name: str, version: str) -> List[Dict]:
+    name_filter = _name_filter()
+    if name_filter is not None and name not in name_filter:
+        return []
+
+    conn = _open_cache()
+    if conn is None:
+        return _query_package(name, version) or []
+    try:
+        vulns = _cache_get(conn, name, version)
+        if vulns is not None:
+            return vulns
+    except (sqlite3.Error, zlib.error, ValueError):
+        return _query_package(name, version) or []
+    # The OSV request runs without holding the cache lock
+    vulns = _query_package(name, version)
+    if vulns is None:
+        # Failed lookups are not cached
+        return []
+    _cache_store(conn, [(name, version, vulns)])
+    return vulns
+
+def _query_batch(packages: List[Package]) -> List[Dict]:
+    """
+    Sends one querybatch request for up to OSV_BATCH_SIZE packages.
+
+    Returns:
+        List[Dict]: One result per package, in the same order. Each result holds
+            the matching vulnerability ids ("vulns") and, if OSV paginated the
+            answer, a "next_page_token".
+    """
+    payload = {
+        "queries": [
+            {"package": {"name": pkg.name}, "version": pkg.version}
+            for pkg in packages
+        ]
+    }
+    try:
+        r = _SESSION.post(OSV_BATCH_API, json=payload, timeout=60)
+        r.raise_for_status()
+        return r.json().get("results", [])
+    except Exception as e:
+        print(f"Error querying OSV batch: {e}")
+        return []
+
+def _fetch_vuln(vuln_id: str) -> Optional[Dict]:
+    """
+    Fetches the full OSV record for a vulnerability id, or None on failure.
+    querybatch only returns ids, so summary/details/affected come from here.
+    """
+    try:
+        r = _SESSION.get(OSV_VULN_API.format(vuln_id), timeout=10)
+        if r.status_code == 200:
+            return r.json()
+    except Exception:
+        pass
+    return None
 
 def scan_system_packages():
     packages = get_installed_packages()
     print(f"Scanning {len(packages)} packages...")
     all_vulns = []
+
+    conn = _open_cache()
+    cached = _cache_load(conn) if conn else {}
+    pending = []
     for pkg in packages:
-        name, version = pkg["name"], pkg["version"]
-        print(f"Checking {name}=={version} ...")
-        vulns = check_package_cves(name, version)
-        if vulns:
-            print(f"  ❗ Found {len(vulns)} vulnerability(ies)")
-            all_vulns.append({"package": pkg, "vulns": vulns})
-        else:
-            print(f"No known vulnerabilities")
+        vulns = cached.get((pkg.name, pkg.version))
+        if vulns is None:
+            pending.append(pkg)
+        elif vulns:
+            all_vulns.append({"package": {"name": pkg.name, "version": pkg.version}, "vulns": vulns})
+    print(f"{len(packages) - len(pending)} package(s) answered from cache")
+
+    # Vulnerability records are shared between packages, fetch each id once
+    details: Dict[str, Optional[Dict]] = {}
+    fresh = []
+
+    with ThreadPoolExecutor(max_workers=OSV_WORKERS) as executor:
+
+        # Names OSV has never seen cannot have vulnerabilities
+        name_filter = _name_filter(build=True) if pending else None
+        if name_filter is not None:
+            pending = [pkg for pkg in pending if pkg.name in name_filter]
+        print(f"Querying OSV for {len(pending)} package(s)...")
+
+        for start in range(0, len(pending), OSV_BATCH_SIZE):
+            chunk = pending[start:start + OSV_BATCH_SIZE]
+            results = _query_batch(chunk)
+
+            # Fetch all new records of this batch concurrently
+            new_ids = {
+                ref["id"]
+                for result in results if not result.get("next_page_token")
+                for ref in result.get("vulns", [])
+                if ref["id"] not in details
+            }
+            for vuln_id, record in zip(new_ids, executor.map(_fetch_vuln, new_ids)):
+                details[vuln_id] = record
+
+            # Paginated answers: the single-package query returns every record
+            paged = {
+                i: executor.submit(_query_package, pkg.name, pkg.version)
+                for i, (pkg, result) in enumerate(zip(chunk, results))
+                if result.get("next_page_token")
+            }
+
+            for i, (pkg, result) in enumerate(zip(chunk, results)):
+                if i in paged:
+                    vulns = paged[i].result()
+                    complete = vulns is not None
+                    vulns = vulns or []
+                else:
+                    refs = [ref["id"] for ref in result.get("vulns", [])]
+                    complete = all(details[vuln_id] is not None for vuln_id in refs)
+                    vulns = [details[vuln_id] or {"id": vuln_id} for vuln_id in refs]
+
+                # Only cache answers where every record could be fetched
+                if complete:
+                    fresh.append((pkg.name, pkg.version, vulns))
+                if vulns:
+                    print(f"  ❗ {pkg.name}=={pkg.version}: {len(vulns)} vulnerability(ies)")
+                    all_vulns.append({"package": {"name": pkg.name, "version": pkg.version}, "vulns": vulns})
+
+    if conn and fresh:
+        _cache_store(conn, fresh)
+    print(f"Found vulnerabilities in {len(all_vulns)} package(s)")
     return all_vulns
 
-def get_installed_packages() -> List[Dict[str, str]]:
+def _cached_packages(source: str, loader) -> List[Package]:
+    """
+    Returns loader() while caching its result on disk.
+
+    The cache is keyed on the mtime and size of `source` (the package database
+    file or directory), which change whenever packages are installed or removed.
+    """
+    try:
+        st = os.stat(source)
+    except OSError:
+        return loader()
+    key = f"{source}:{st.st_mtime_ns}:{st.st_size}"
+
+    try:
+        with open(PACKAGE_CACHE_PATH, "rb") as f:
+            cached = orjson.loads(f.read())
+        if cached.get("key") == key:
+            return [Package(name, version) for name, version in cached["packages"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    packages = loader()
+    if packages:
+        tmp_path = PACKAGE_CACHE_PATH + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(PACKAGE_CACHE_PATH), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps({"key": key, "packages": [(p.name, p.version) for p in packages]}))
+            os.replace(tmp_path, PACKAGE_CACHE_PATH)
+        except OSError:
+            pass
+    return packages
+
+def get_installed_packages() -> List[Package]:
     """
     Fetches a list of installed packages on the system based on the operating system.
 
@@ -42,14 +401,14 @@ def get_installed_packages() -> List[Dict[str, str]]:
     - `brew` on macOS
 
     Returns:
-        List[Dict[str, str]]: A list of dictionaries where each dictionary contains:
-            - "name": The name of the package (e.g., "python3", "curl")
-            - "version": The installed version of the package (e.g., "3.9.2-1")
+        List[Package]: A list of packages, each with:
+            - name: The name of the package (e.g., "python3", "curl")
+            - version: The installed version of the package (e.g., "3.9.2-1")
 
     Example:
         [
-            {"name": "curl", "version": "7.74.0-1.3+b1"},
-            {"name": "python3", "version": "3.9.2-3"}
+            Package(name="curl", version="7.74.0-1.3+b1"),
+            Package(name="python3", version="3.9.2-3")
         ]
     """
     system = platform.system()
@@ -66,15 +425,15 @@ def get_installed_packages() -> List[Dict[str, str]]:
 
         # Choose the correct package manager based on the detected distribution
         if distro in ["ubuntu", "debian", "raspbian"]:
-            return _get_deb_packages()
+            return _cached_packages(DPKG_STATUS_PATH, _get_deb_packages)
         elif distro in ["arch", "manjaro", "artix"]:
-            return _get_arch_packages()
+            return _cached_packages(PACMAN_LOCAL_DIR, _get_arch_packages)
         elif distro in ["fedora", "rhel", "centos", "almalinux", "rocky"]:
             return _get_rpm_packages()
         else:
             # Default to dpkg if distribution is unknown or not explicitly handled
             print(f"Warning: Unknown Linux distribution '{distro}', attempting dpkg method...")
-            return _get_deb_packages()
+            return _cached_packages(DPKG_STATUS_PATH, _get_deb_packages)
 
     elif system == "Darwin":  # macOS
         # macOS typically uses Homebrew as a package manager
@@ -85,15 +444,46 @@ def get_installed_packages() -> List[Dict[str, str]]:
         print(f"Warning: Unsupported operating system: {system}")
         return []
 
-def _get_deb_packages() -> List[Dict[str, str]]:
+def _get_deb_packages() -> List[Package]:
     """
     Helper function to retrieve installed packages on Debian-based systems (e.g., Ubuntu).
 
-    Uses the `dpkg -l` command to list all installed packages.
+    Parses the dpkg database (/var/lib/dpkg/status) directly: one stanza per package
+    with "Package:", "Status:" and "Version:" fields. This avoids spawning dpkg and
+    its column formatting, which truncates long names and versions.
+    Falls back to `dpkg -l` if the file cannot be read.
+
+    Returns:
+        List[Package]: List of packages with name and version
+    """
+    try:
+        with open(DPKG_STATUS_PATH, encoding="utf-8", errors="replace") as f:
+            content = f.read()
+    except OSError:
+        return _get_deb_packages_dpkg()
+
+    packages = []
+    for stanza in content.split("\n\n"):
+        name = version = status = None
+        for line in stanza.splitlines():
+            if line.startswith("Package: "):
+                name = line[9:]
+            elif line.startswith("Version: "):
+                version = line[9:]
+            elif line.startswith("Status: "):
+                status = line[8:]
+        # Same as the "ii" lines of `dpkg -l`
+        if name and version and status == "install ok installed":
+            packages.append(Package(name, version))
+    return packages
+
+def _get_deb_packages_dpkg() -> List[Package]:
+    """
+    Fallback for _get_deb_packages using the `dpkg -l` command.
     The output format is parsed to extract package name and version.
 
     Returns:
-        List[Dict[str, str]]: List of packages in the form {"name": ..., "version": ...}
+        List[Package]: List of packages with name and version
     """
     try:
         # Run 'dpkg -l' to list installed packages
@@ -116,21 +506,50 @@ def _get_deb_packages() -> List[Dict[str, str]]:
                 if len(parts) >= 3:
                     name = parts[1]      # Package name
                     version = parts[2]   # Package version
-                    packages.append({"name": name, "version": version})
+                    packages.append(Package(name, version))
         return packages
     except Exception as e:
         print(f"Error reading dpkg packages: {e}")
         return []
 
-def _get_arch_packages() -> List[Dict[str, str]]:
+def _get_arch_packages() -> List[Package]:
     """
     Helper function to retrieve installed packages on Arch Linux-based systems.
 
-    Uses the `pacman -Q` command to list all installed packages.
+    Reads the pacman local database directly: every installed package has a
+    /var/lib/pacman/local/<name>-<version>/desc file with "%NAME%" and "%VERSION%"
+    sections. Falls back to `pacman -Q` if the database cannot be read.
+
+    Returns:
+        List[Package]: List of packages with name and version
+    """
+    try:
+        entries = [entry.path for entry in os.scandir(PACMAN_LOCAL_DIR) if entry.is_dir()]
+    except OSError:
+        return _get_arch_packages_pacman()
+
+    packages = []
+    for path in entries:
+        try:
+            with open(os.path.join(path, "desc"), encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        fields = {}
+        for i, line in enumerate(lines[:-1]):
+            if line in ("%NAME%", "%VERSION%"):
+                fields[line] = lines[i + 1]
+        if "%NAME%" in fields and "%VERSION%" in fields:
+            packages.append(Package(fields["%NAME%"], fields["%VERSION%"]))
+    return packages
+
+def _get_arch_packages_pacman() -> List[Package]:
+    """
+    Fallback for _get_arch_packages using the `pacman -Q` command.
     The output is in the format: <package_name> <version>
 
     Returns:
-        List[Dict[str, str]]: List of packages in the form {"name": ..., "version": ...}
+        List[Package]: List of packages with name and version
     """
     try:
         # Run 'pacman -Q' to list installed packages
@@ -150,13 +569,13 @@ def _get_arch_packages() -> List[Dict[str, str]]:
             if len(parts) >= 2:
                 name = parts[0]
                 version = parts[1]
-                packages.append({"name": name, "version": version})
+                packages.append(Package(name, version))
         return packages
     except Exception as e:
         print(f"Error reading pacman packages: {e}")
         return []
 
-def _get_rpm_packages() -> List[Dict[str, str]]:
+def _get_rpm_packages() -> List[Package]:
     """
     Helper function to retrieve installed packages on RPM-based systems (e.g., Fedora, RHEL, CentOS).
 
@@ -164,7 +583,7 @@ def _get_rpm_packages() -> List[Dict[str, str]]:
     The format string ensures consistent output.
 
     Returns:
-        List[Dict[str, str]]: List of packages in the form {"name": ..., "version": ...}
+        List[Package]: List of packages with name and version
     """
     try:
         # Run 'rpm -qa' with a custom format to get name and version only
@@ -183,20 +602,20 @@ def _get_rpm_packages() -> List[Dict[str, str]]:
             parts = line.split(maxsplit=1)  # Split only at first space to avoid splitting version
             if len(parts) == 2:
                 name, version = parts
-                packages.append({"name": name, "version": version})
+                packages.append(Package(name, version))
         return packages
     except Exception as e:
         print(f"Error reading rpm packages: {e}")
         return []
 
-def _get_brew_packages() -> List[Dict[str, str]]:
+def _get_brew_packages() -> List[Package]:
     """
     Helper function to retrieve installed packages on macOS using Homebrew.
 
     Uses the `brew list --versions` command to list installed packages with their versions.
 
     Returns:
-        List[Dict[str, str]]: List of packages in the form {"name": ..., "version": ...}
+        List[Package]: List of packages with name and version
     """
     try:
         # Run 'brew list --versions' to get installed packages with versions
@@ -217,7 +636,7 @@ def _get_brew_packages() -> List[Dict[str, str]]:
             if len(parts) >= 2:
                 name = parts[0]      # Package name
                 version = parts[1]   # First version (usually the active one)
-                packages.append({"name": name, "version": version})
+                packages.append(Package(name, version))
         return packages
     except Exception as e:
         print(f"Error reading Homebrew packages: {e}")
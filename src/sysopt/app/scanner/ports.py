@@ -1,7 +1,25 @@
+import errno           # error codes returned by connect_ex
+import resource        # limit on open file descriptors
+import random
+import selectors       # wait on many sockets at once (epoll on Linux)
 import socket          # connect to network ports
-from concurrent.futures import ThreadPoolExecutor  # run multiple tasks at the same time
+import struct          # build raw TCP headers
+import time
+from collections import deque
 from typing import Dict 
 
+# TCP header flags
+TCP_SYN = 0x02
+TCP_SYN_ACK = 0x12
+SYN_SCAN_RCVBUF = 8 * 1024 * 1024
+# SO_RCVBUFFORCE (Linux): like SO_RCVBUF, but not capped at net.core.rmem_max.
+# Needs CAP_NET_ADMIN.
+SO_RCVBUFFORCE = getattr(socket, "SO_RCVBUFFORCE", 33)
+# SYN packets sent per second. The replies come back at about the same rate, so this
+# keeps the raw socket's receive buffer from overflowing (dropped replies would be
+# reported as closed ports)
+SYN_SCAN_RATE = 10000
+
 def scan_port(host, port, timeout=0.5):
     """
     This function checks if a single port on a computer is open or closed.
@@ -33,15 +51,38 @@ def scan_port(host, port, timeout=0.5):
         return False
 
 
-def scan_ports(host, ports=None, workers=50):
+def _max_in_flight(requested):
+    """
+    Limits the number of sockets open at the same time to what the process may open.
+    Every pending connection uses one file descriptor; some are kept free for the app.
+    """
+    try:
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ValueError, OSError):
+        return requested
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft - 64))
+
+
+def scan_ports(host, ports=None, timeout=0.5, max_in_flight=2048, syn_scan=False):
     """
     This function checks multiple ports on a computer at the same time.
-    It uses multiple threads to make the scanning faster.
+    
+    By default it starts many non-blocking connections and lets the operating system
+    tell us (via epoll/select) which ones finished.
+    With syn_scan=True, and if the process may open raw sockets (root or CAP_NET_RAW),
+    it does a SYN scan instead: it only sends the first packet of a TCP handshake and
+    listens for the answers.
     
     Args:
         host (str): The computer we want to check
-        ports (list): List of port numbers to check (if None, checks all ports 1-65535)
-        workers (int): How many connections to try at the same time
+        ports (Iterable[int]): Port numbers to check, e.g. a list or range
+                               (if None, checks all ports 1-65535)
+        timeout (float): How long to wait for each port before calling it closed (in seconds)
+        max_in_flight (int): How many connections may be pending at the same time
+                             (connect scan only)
+        syn_scan (bool): Use a raw-socket SYN scan when allowed (default: False)
     
     Returns:
         dict: A dictionary with open ports as keys and True as values
@@ -50,33 +91,180 @@ def scan_ports(host, ports=None, workers=50):
     
     # If no ports are given, check all possible ports (1 to 65535)
     if ports is None:
-        ports = list(range(1, 65536))  
+        ports = range(1, 65536)
+    
+    # Resolve the host name once instead of once per connection
+    address = socket.gethostbyname(host)
+    
+    if not syn_scan:
+        return _connect_scan(address, ports, timeout, max_in_flight)
+    try:
+        raw_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+    except PermissionError:
+        # Not privileged: use normal connections instead
+        return _connect_scan(address, ports, timeout, max_in_flight)
+    with raw_socket:
+        return _syn_scan(raw_socket, address, ports, timeout)
+
+
+def _checksum(data):
+    """The internet checksum (RFC 1071) used in IP and TCP headers."""
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def _syn_packet(src_ip, dst_ip, src_port, dst_port, seq):
+    """
+    Builds a TCP header with only the SYN flag set. The kernel adds the IP header.
+    The checksum covers a "pseudo header" made of both addresses, the protocol and the length.
+    """
+    header = struct.pack("!HHIIBBHHH", src_port, dst_port, seq, 0, 5 << 4, TCP_SYN, 65535, 0, 0)
+    pseudo = struct.pack("!4s4sBBH", src_ip, dst_ip, 0, socket.IPPROTO_TCP, len(header))
+    checksum = _checksum(pseudo + header)
+    return header[:16] + struct.pack("!H", checksum) + header[18:]
+
+
+def _syn_scan(raw_socket, address, ports, timeout):
+    """
+    Sends one SYN packet per port and collects the replies on the same raw socket.
     
-    results = {}
+    An open port answers with SYN+ACK, a closed one with RST, a filtered one not at all.
+    Our kernel has no connection for the SYN+ACK and resets it, so nothing stays open.
+    Ports that did not answer within 'timeout' after the last packet count as closed.
+    A reply only counts if it acknowledges our sequence number (ack == seq + 1).
+    """
+    dst_ip = socket.inet_aton(address)
+    # Ask the routing table which local address is used to reach the target
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.connect((address, 9))
+        src_ip = socket.inet_aton(probe.getsockname()[0])
     
-    executor = ThreadPoolExecutor(max_workers=workers)
-    future_to_port = {}
+    # All probes use one random source port so replies are easy to match
+    src_port = random.randint(40000, 60999)
+    seq = random.getrandbits(32)
+    expected_ack = (seq + 1) & 0xFFFFFFFF
+    # A range answers "port in wanted" without building a set of every port
+    wanted = ports if isinstance(ports, range) else frozenset(ports)
+    open_ports = {}
     
-    # Submit all the port scanning tasks to the executor
-    for port in ports:
-        future = executor.submit(scan_port, host, port)
-        future_to_port[future] = port
+    def read_replies():
+        while True:
+            try:
+                packet = raw_socket.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            ip_header_length = (packet[0] & 0x0F) * 4
+            if packet[12:16] != dst_ip or len(packet) < ip_header_length + 14:
+                continue
+            sport, dport, _, ack = struct.unpack_from("!HHII", packet, ip_header_length)
+            flags = packet[ip_header_length + 13]
+            if (dport == src_port and ack == expected_ack and sport in wanted
+                    and flags & TCP_SYN_ACK == TCP_SYN_ACK):
+                open_ports[sport] = True
     
-    for future in future_to_port:
-        port = future_to_port[future]  
-        is_open = future.result()     
+    raw_socket.setblocking(False)
+    # The raw socket sees every incoming TCP packet of the host, so give replies room.
+    # Plain SO_RCVBUF is capped at net.core.rmem_max (about 208 KB by default)
+    try:
+        raw_socket.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, SYN_SCAN_RCVBUF)
+    except OSError:
+        raw_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SYN_SCAN_RCVBUF)
+    with selectors.DefaultSelector() as selector:
+        selector.register(raw_socket, selectors.EVENT_READ)
+        start = time.monotonic()
+        for i, port in enumerate(wanted):
+            # Pace the sends, reading replies while waiting for the next slot
+            while (ahead := start + i / SYN_SCAN_RATE - time.monotonic()) > 0:
+                if selector.select(ahead):
+                    read_replies()
+            packet = _syn_packet(src_ip, dst_ip, src_port, port, seq)
+            while True:
+                try:
+                    raw_socket.sendto(packet, (address, 0))
+                    break
+                except (BlockingIOError, InterruptedError):
+                    read_replies()
+                except OSError as e:
+                    # Send buffer full: let the NIC catch up
+                    if e.errno != errno.ENOBUFS:
+                        raise
+                    time.sleep(0.001)
+            if i % 64 == 0:
+                read_replies()
         
-        results[port] = is_open
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            if selector.select(remaining):
+                read_replies()
     
-    # Close the executor 
-    executor.shutdown()
+    return dict(sorted(open_ports.items()))
+
+
+def _connect_scan(address, ports, timeout, max_in_flight):
+    """
+    Connect scan used when raw sockets are not allowed: one non-blocking
+    connect() per port, many at the same time on a single selector.
+    """
+    limit = _max_in_flight(max_in_flight)
     
     open_ports = {}
-    for port, is_open in results.items():
-        if is_open:  
-            open_ports[port] = is_open
+    port_iter = iter(ports)
+    selector = selectors.DefaultSelector()
+    # All connections share the same timeout, so they expire in the order they were started
+    deadlines = deque()
     
-    return open_ports
+    def start_connections():
+        while len(deadlines) < limit:
+            port = next(port_iter, None)
+            if port is None:
+                return
+            socket_obj = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            socket_obj.setblocking(False)
+            # connect_ex returns an error code instead of raising;
+            # EINPROGRESS means "connection started, result comes later"
+            error = socket_obj.connect_ex((address, port))
+            if error == 0:
+                open_ports[port] = True
+                socket_obj.close()
+            elif error == errno.EINPROGRESS:
+                selector.register(socket_obj, selectors.EVENT_WRITE, port)
+                deadlines.append((time.monotonic() + timeout, socket_obj))
+            else:
+                socket_obj.close()
+    
+    try:
+        start_connections()
+        while deadlines:
+            wait = max(0.0, deadlines[0][0] - time.monotonic())
+            
+            # A socket becomes writable once the connection succeeded or failed
+            for key, _ in selector.select(wait):
+                socket_obj = key.fileobj
+                if socket_obj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    open_ports[key.data] = True
+                selector.unregister(socket_obj)
+                socket_obj.close()
+            
+            # Drop finished sockets and give up on those that took too long
+            now = time.monotonic()
+            while deadlines and (deadlines[0][1].fileno() == -1 or deadlines[0][0] <= now):
+                _, socket_obj = deadlines.popleft()
+                if socket_obj.fileno() != -1:
+                    selector.unregister(socket_obj)
+                    socket_obj.close()
+            
+            start_connections()
+    finally:
+        for _, socket_obj in deadlines:
+            socket_obj.close()
+        selector.close()
+    
+    return dict(sorted(open_ports.items()))
+
 
 if __name__ == "__main__":
     # Check ports 22 (SSH), 80 (HTTP), 443 (HTTPS), 9000 (custom)
@@ -1,44 +1,19 @@
+import time
 import psutil
 from typing import List, Tuple
 
+# Seconds between the two samples used to compute per-process CPU usage
+CPU_SAMPLE_INTERVAL = 0.1
 
-def top_memory_processes(n=10):
-    """
-    Returns a list of the top 'n' processes consuming the most physical memory (RSS).
-
-    This function iterates through all currently running processes and collects
-    their memory usage (Resident Set Size - RSS), which represents the portion
-    of memory that is held in RAM. It then sorts the processes by memory usage
-    in descending order and returns the top 'n' entries.
-
-    Args:
-        n (int): The number of top memory-consuming processes to return.
-                 Defaults to 10. If set to a higher number than available
-                 processes, all processes will be returned.
-
-    Returns:
-        List[Tuple]: A list of tuples, each containing:
-            - int: Memory usage in bytes (RSS - Resident Set Size)
-            - str: Name of the process
-            - int: Process ID (PID)
-
-    Example:
-        >>> top_memory_processes(3)
-        [(123456789, 'firefox', 1234), (987654321, 'chrome', 5678), (456123789, 'code', 91011)]
-    """
-    procs = []
-    for proc in psutil.process_iter(['pid', 'name', 'memory_info']):
-        try:
-            mem = proc.info['memory_info'].rss
-            procs.append((mem, proc.info['name'], proc.info['pid']))
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
-    return sorted(procs, key=lambda x: x[0], reverse=True)[:n]
 
 def top_processes(n: int = 10, sort_by: str = "memory") -> List[Tuple]:
     """
     Returns a list of top processes based on memory or CPU usage.
 
+    CPU usage is measured over CPU_SAMPLE_INTERVAL: all processes are sampled once,
+    then read again after a single short sleep. (A process' first cpu_percent()
+    call always returns 0.0.) Sorting by memory needs no sampling.
+
     Args:
         n (int): Number of top processes to return (default: 10)
         sort_by (str): Sort by "memory" or "cpu" (default: "memory")
@@ -49,25 +24,77 @@ def top_processes(n: int = 10, sort_by: str = "memory") -> List[Tuple]:
                      - For CPU: (CPU %, name, pid)
     """
     procs = []
-    for proc in psutil.process_iter(['pid', 'name', 'memory_info', 'cpu_percent']):
+    if sort_by == "memory":
+        for proc in psutil.process_iter(['pid', 'name', 'memory_info']):
+            # process_iter reads the requested attributes inside oneshot() already
+            mem_info = proc.info['memory_info']
+            # Attributes that could not be read (AccessDenied) are None
+            if mem_info is not None:
+                procs.append((mem_info.rss, proc.info['name'], proc.info['pid']))
+
+    elif sort_by == "cpu":
+        sampled = []
+        for proc in psutil.process_iter():
+            try:
+                # oneshot() reads /proc/<pid>/stat once for both the name and the CPU times
+                with proc.oneshot():
+                    name = proc.name()
+                    proc.cpu_percent(None)
+                sampled.append((proc, name))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                # Process may have terminated or is not accessible
+                pass
+
+        time.sleep(CPU_SAMPLE_INTERVAL)
+
+        for proc, name in sampled:
+            try:
+                procs.append((proc.cpu_percent(None), name, proc.pid))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    sorted_procs = sorted(procs, key=lambda x: x[0], reverse=True)
+    return sorted_procs[:n]
+
+def top_processes_combined(n: int = 10) -> Tuple[List[Tuple], List[Tuple]]:
+    """
+    Returns the top processes by memory and by CPU usage from a single pass over /proc.
+
+    Use this instead of calling top_memory_processes and top_cpu_processes back to back.
+
+    Args:
+        n (int): Number of top processes to return per list (default: 10)
+
+    Returns:
+        Tuple[List[Tuple], List[Tuple]]: (by_memory, by_cpu), with (RSS in bytes, name, pid)
+                                         and (CPU %, name, pid) tuples respectively
+    """
+    sampled = []
+    for proc in psutil.process_iter():
         try:
-            # Ensure the CPU percent is updated by calling it once
-            cpu_percent = proc.cpu_percent()
-            mem_info = proc.memory_info()
-            name = proc.info['name']
-            pid = proc.info['pid']
-
-            if sort_by == "memory":
-                value = mem_info.rss  # RSS = Resident Set Size (physical memory used)
-                procs.append((value, name, pid))
-            elif sort_by == "cpu":
-                procs.append((cpu_percent, name, pid))
+            with proc.oneshot():
+                name = proc.name()
+                rss = proc.memory_info().rss
+                proc.cpu_percent(None)
+            sampled.append((proc, name, rss))
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             # Process may have terminated or is not accessible
             pass
 
-    sorted_procs = sorted(procs, key=lambda x: x[0], reverse=True)
-    return sorted_procs[:n]
+    time.sleep(CPU_SAMPLE_INTERVAL)
+
+    by_memory = []
+    by_cpu = []
+    for proc, name, rss in sampled:
+        by_memory.append((rss, name, proc.pid))
+        try:
+            by_cpu.append((proc.cpu_percent(None), name, proc.pid))
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+
+    by_memory.sort(key=lambda x: x[0], reverse=True)
+    by_cpu.sort(key=lambda x: x[0], reverse=True)
+    return by_memory[:n], by_cpu[:n]
 
 def top_memory_processes(n: int = 10) -> List[Tuple]:
     """
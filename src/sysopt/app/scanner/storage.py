@@ -1,14 +1,88 @@
+import heapq
 import os
+import queue
 import subprocess
+import sys
 import json
-from typing import List, Tuple
+import orjson
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Tuple
+
+# Directory names that are never worth descending into when looking for large files
+SKIP_DIR_NAMES = {".git", "node_modules", "__pycache__"}
+# Virtual filesystems without real files on disk
+SKIP_DIR_PATHS = {"/proc", "/sys", "/dev", "/run"}
+
+# Directories read concurrently; several outstanding reads keep SSDs and network mounts busy
+WALK_WORKERS = 8
+
+def _scan_dir(path: str) -> Tuple[List[Tuple[int, str]], List[Tuple[Tuple[int, int], str]]]:
+    """
+    Reads a single directory.
+
+    Uses os.scandir so the file type comes from the directory listing itself and
+    each file needs only one stat() call. Symlinks are not followed.
+
+    Returns:
+        Tuple: (files, subdirs) where files are (size, path) tuples and subdirs are
+               ((st_dev, st_ino), path) tuples. An unreadable directory yields nothing.
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIR_NAMES and entry.path not in SKIP_DIR_PATHS:
+                            st = entry.stat(follow_symlinks=False)
+                            subdirs.append(((st.st_dev, st.st_ino), entry.path))
+                    elif entry.is_file(follow_symlinks=False):
+                        files.append((entry.stat(follow_symlinks=False).st_size, entry.path))
+                except OSError:
+                    # Skip entries that cannot be accessed (e.g., permission denied)
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+def _walk(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    Recursively yields (size, path) for every regular file below 'path'.
+
+    Directories are read by a pool of WALK_WORKERS threads; the caller consumes the
+    results in its own thread, so it needs no locking. Each directory is visited
+    once per (device, inode), which guards against bind-mount loops.
+    """
+    seen = set()
+    try:
+        st = os.stat(path)
+        seen.add((st.st_dev, st.st_ino))
+    except OSError:
+        return
+
+    # Finished directory reads arrive in completion order on this queue
+    results: "queue.Queue[Future]" = queue.Queue()
+    with ThreadPoolExecutor(max_workers=WALK_WORKERS) as executor:
+        executor.submit(_scan_dir, path).add_done_callback(results.put)
+        outstanding = 1
+        while outstanding:
+            files, subdirs = results.get().result()
+            outstanding -= 1
+            for key, subdir in subdirs:
+                if key not in seen:
+                    seen.add(key)
+                    executor.submit(_scan_dir, subdir).add_done_callback(results.put)
+                    outstanding += 1
+            yield from files
 
 def find_largest_files(start_path: str = None, max_files: int = 25) -> List[Tuple[int, str]]:
     """
     Scans the given directory (or home directory by default) and returns the largest files.
 
-    This function recursively walks through all subdirectories starting from 'start_path',
-    collects file paths and their sizes, and returns the top 'max_files' largest files
+    This function recursively walks through all subdirectories starting from 'start_path'
+    (skipping SKIP_DIR_NAMES and virtual filesystems), collects file paths and their
+    sizes, and returns the top 'max_files' largest files
     sorted by size in descending order.
 
     Args:
@@ -29,23 +103,20 @@ def find_largest_files(start_path: str = None, max_files: int = 25) -> List[Tupl
     if start_path is None:
         start_path = os.path.expanduser("~")
 
-    files = []
+    if max_files <= 0:
+        return []
 
-    # Walk through all directories and subdirectories
-    for root, _, filenames in os.walk(start_path):
-        for filename in filenames:
-            full_path = os.path.join(root, filename)
+    # Min-heap of the largest files seen so far; heap[0] is the smallest of them
+    heap: List[Tuple[int, str]] = []
+    for item in _walk(start_path):
+        if len(heap) < max_files:
+            heapq.heappush(heap, item)
+        elif item[0] > heap[0][0]:
+            heapq.heapreplace(heap, item)
 
-            # Attempt to get file size
-            try:
-                size = os.path.getsize(full_path)
-                files.append((size, full_path))
-            except OSError:
-                # Skip files that cannot be accessed (e.g., permission denied)
-                continue
+    return sorted(heap, reverse=True)
 
-    sorted_files = sorted(files, key=lambda x: x[0], reverse=True)
-    return sorted_files[:max_files]
+BYTE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
 
 def format_bytes(size_in_bytes: int) -> str:
     """
@@ -57,11 +128,10 @@ def format_bytes(size_in_bytes: int) -> str:
     Returns:
         str: Human-readable size string (e.g., "2.5 GB", "1024.0 MB").
     """
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if size_in_bytes < 1024.0:
-            return f"{size_in_bytes:.1f} {unit}"
-        size_in_bytes /= 1024.0
-    return f"{size_in_bytes:.1f} PB"
+    # 1024 == 2**10, so the unit index is the number of whole 10-bit groups above the first
+    size = int(size_in_bytes)
+    i = min(max(0, (size.bit_length() - 1) // 10), len(BYTE_UNITS) - 1)
+    return f"{size / (1 << (i * 10)):.1f} {BYTE_UNITS[i]}"
 
 def print_largest_files(start_path: str = None, max_files: int = 25):
     """
@@ -72,16 +142,19 @@ def print_largest_files(start_path: str = None, max_files: int = 25):
         max_files (int, optional): Number of largest files to display. Defaults to 25.
     """
     files = find_largest_files(start_path, max_files)
-    print(f"Top {len(files)} largest files:")
-    for size, path in files:
-        print(f"{format_bytes(size):>10} | {path}")
+    # Build the whole report and write it at once
+    lines = [f"Top {len(files)} largest files:"]
+    lines.extend(f"{format_bytes(size):>10} | {path}" for size, path in files)
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
 
 def read_ssd_smart_data() -> dict[str, any]:
     """
     Reads SMART data from all connected drives using 'smartctl' from smartmontools.
 
-    This function runs 'smartctl --json --scan' to list all drives,
-    then reads SMART data from each drive using 'smartctl --json --all'.
+    This function runs 'smartctl --json=c --scan' to list all drives,
+    then reads SMART data from all drives in parallel using 'smartctl --json=c --all'.
+    Compact JSON output is parsed straight from the raw bytes with orjson.
 
     Returns:
         Dict[str, Any]: A dictionary mapping device names to their SMART data.
@@ -90,28 +163,30 @@ def read_ssd_smart_data() -> dict[str, any]:
     try:
         # Scan for drives
         result = subprocess.run(
-            ["smartctl", "--json", "--scan"],
+            ["smartctl", "--json=c", "--scan"],
             capture_output=True,
-            text=True,
             check=True
         )
-        scan_data = json.loads(result.stdout)
+        scan_data = orjson.loads(result.stdout)
         drives = scan_data.get("devices", [])
 
         smart_data = {}
-        for drive in drives:
-            device_name = drive["name"]
-            device_type = drive["type"]
-
-            # Read SMART data for each drive
-            smart_result = subprocess.run(
-                ["smartctl", "--json", "--all", device_name],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            smart_output = json.loads(smart_result.stdout)
-            smart_data[device_name] = smart_output
+        if not drives:
+            return smart_data
+
+        # Read SMART data for all drives at the same time; each query waits on the device
+        with ThreadPoolExecutor(max_workers=len(drives)) as executor:
+            futures = {
+                executor.submit(
+                    subprocess.run,
+                    ["smartctl", "--json=c", "--all", drive["name"]],
+                    capture_output=True,
+                    check=True
+                ): drive["name"]
+                for drive in drives
+            }
+            for future in as_completed(futures):
+                smart_data[futures[future]] = orjson.loads(future.result().stdout)
 
         return smart_data
 
@@ -179,13 +254,17 @@ def print_ssd_health_report():
 
     health_report = analyze_ssd_health(smart_data)
 
+    lines = []
     for device, report in health_report.items():
-        print(f"\nDevice: {device}")
-        print(f"Health Status: {report['status']}")
+        lines.append(f"\nDevice: {device}")
+        lines.append(f"Health Status: {report['status']}")
         if report["attributes"]:
-            print("Relevant SMART Attributes:")
+            lines.append("Relevant SMART Attributes:")
             for attr in report["attributes"]:
-                print(f"  - {attr['name']}: {attr['value']} (Threshold: {attr['threshold']}) [{attr['flags']}]")
+                lines.append(f"  - {attr['name']}: {attr['value']} (Threshold: {attr['threshold']}) [{attr['flags']}]")
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
 
 
 if __name__ == "__main__":
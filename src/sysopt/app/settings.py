@@ -0,0 +1,55 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """
+    Application configuration, read once from the environment.
+
+    `.env` is loaded by the entry point (main.py) before this module is imported,
+    so the values here reflect it. Changing the configuration via /setup restarts
+    the process, which builds a fresh snapshot.
+    """
+
+    prefix: str
+    llm_api_key: Optional[str]
+    ip: Optional[str]
+    ollama_host: str
+    ollama_port: str
+    ollama_model: str
+    mcp_server_ip: str
+    mcp_server_port: str
+    webui_port: str
+    # Raw-socket SYN scan for /scan/ports (needs root or CAP_NET_RAW); off unless enabled
+    syn_scan: bool
+
+    @property
+    def mcp_base_url(self) -> str:
+        return f"http://{self.mcp_server_ip}:{self.mcp_server_port}"
+
+    @property
+    def ollama_base_url(self) -> str:
+        return f"http://{self.ollama_host}:{self.ollama_port}"
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def load() -> "Settings":
+        env = os.environ
+        return Settings(
+            prefix=env.get("PREFIX", ""),
+            llm_api_key=env.get("LLM_API_KEY"),
+            ip=env.get("IP"),
+            ollama_host=env.get("OLLAMA_HOST", "localhost"),
+            ollama_port=env.get("OLLAMA_PORT", "11434"),
+            ollama_model=env.get("OLLAMA_MODEL", "llama3.2"),
+            mcp_server_ip=env.get("MCP_SERVER_IP", "127.0.0.1"),
+            mcp_server_port=env.get("MCP_SERVER_PORT", "8766"),
+            webui_port=env.get("WEBUI_PORT", "8000"),
+            syn_scan=env.get("SYN_SCAN", "").lower() in ("1", "true", "yes"),
+        )
+
+
+SETTINGS = Settings.load()
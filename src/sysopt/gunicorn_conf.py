@@ -0,0 +1,29 @@
+"""
+Gunicorn configuration for the SysOpt web UI.
+
+Run from this directory:
+
+    gunicorn -c gunicorn_conf.py app.main:app
+"""
+import os
+
+from dotenv import load_dotenv
+
+# Re-read .env on every (re)load so a SIGHUP after /save_config picks up the new values.
+load_dotenv(override=True)
+
+bind = f"0.0.0.0:{os.getenv('WEBUI_PORT', '8000')}"
+
+# Requests mostly wait on Ollama, the MCP server or subprocesses, so threads
+# give the concurrency while the worker processes spread the JSON/scan work.
+workers = 2 * (os.cpu_count() or 1) + 1
+worker_class = "gthread"
+threads = 8
+
+# Agent streams and bottle installs can run for many minutes.
+timeout = 1200
+graceful_timeout = 30
+keepalive = 5
+
+# Tells the app it is served by gunicorn (see _restart in app/main.py).
+raw_env = ["SYSOPT_GUNICORN=1"]
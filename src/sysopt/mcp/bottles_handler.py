@@ -1,85 +1,329 @@
 from __future__ import annotations
 
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import selectors
+import shlex
+import signal
+import stat
+import sys
+import tempfile
+import threading
 import uuid
 import yaml
 import os
 import subprocess
 import time
 import shutil
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from shutil import which
-from collections import defaultdict
+from collections import defaultdict, deque
 from pathlib import Path
-from .dll_map import DLL_MAP
 
 # ------------------------------------------------------------------
 # Detect Bottles Installation
 # ------------------------------------------------------------------
-def detect_bottles_commands() -> Dict[str, Any]:
+# Detection result survives restarts; it is re-probed after a day or when the
+# flatpak binary changes (upgrade / install / removal).
+# The cached argv lists are executed later, so the cache lives in a private
+# per-user directory and is only trusted when nobody else could have written it.
+_CMD_CACHE_DIR = (
+    Path(os.environ["XDG_RUNTIME_DIR"]) if os.environ.get("XDG_RUNTIME_DIR")
+    else Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "sysopt"
+)
+_CMD_CACHE_PATH = _CMD_CACHE_DIR / "sysopt_bottles_cmd.json"
+_CMD_CACHE_TTL = 24 * 3600
+
+def _flatpak_key() -> str:
+    flatpak = which("flatpak")
+    if not flatpak:
+        return "none"
     try:
-        result = subprocess.run(
-            ["flatpak", "list", "--app", "--columns=application"],
-            capture_output=True, text=True, check=False
-        )
-        if "com.usebottles.bottles" in result.stdout:
-            return {
-                "bottles_cli": ["flatpak", "run", "--command=bottles-cli", "com.usebottles.bottles"],
-                "wine_cmd": ["flatpak", "run", "--command=wine", "com.usebottles.bottles"],
-                "winetricks": ["flatpak", "run", "--command=winetricks", "com.usebottles.bottles"],
-                "winedump": ["flatpak", "run", "--command=winedump", "com.usebottles.bottles"],
-                "wineserver": ["flatpak", "run", "--command=wineserver", "com.usebottles.bottles"],
-                "type": "flatpak"
-            }
-    except Exception:
+        st = os.stat(flatpak)
+    except OSError:
+        return "none"
+    return f"{flatpak}:{st.st_mtime_ns}:{st.st_size}"
+
+def _is_private(st: os.stat_result) -> bool:
+    # Owned by us and not writable by group or others
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def _load_cache(key: str) -> Optional[Dict[str, Any]]:
+    try:
+        if not _is_private(os.stat(_CMD_CACHE_DIR)):
+            return None
+        fd = os.open(_CMD_CACHE_PATH, os.O_RDONLY | os.O_NOFOLLOW)
+        with os.fdopen(fd, "rb") as f:
+            st = os.fstat(f.fileno())
+            if not stat.S_ISREG(st.st_mode) or not _is_private(st):
+                return None
+            if time.time() - st.st_mtime > _CMD_CACHE_TTL:
+                return None
+            data = json.loads(f.read())
+        return data["commands"] if data.get("key") == key else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _save_cache(key: str, commands: Dict[str, Any]) -> None:
+    try:
+        _CMD_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        if not _is_private(os.stat(_CMD_CACHE_DIR)):
+            return
+        # mkstemp creates the file with mode 0600 under an unpredictable name
+        fd, tmp = tempfile.mkstemp(dir=_CMD_CACHE_DIR, prefix=".sysopt_bottles_cmd.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(json.dumps({"key": key, "commands": commands}))
+            os.replace(tmp, _CMD_CACHE_PATH)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
         pass
 
+def _absolute_commands(commands: Dict[str, Any]) -> Dict[str, Any]:
+    # With an absolute executable (and close_fds=False) subprocess can use
+    # posix_spawn() instead of fork() + exec()
+    return {
+        key: [which(cmd[0]) or cmd[0], *cmd[1:]] if isinstance(cmd, list) else cmd
+        for key, cmd in commands.items()
+    }
+
+def _probe_bottles_commands(has_flatpak: bool) -> Dict[str, Any]:
+    if has_flatpak:
+        try:
+            result = subprocess.run(
+                ["flatpak", "list", "--app", "--columns=application"],
+                capture_output=True, text=True, check=False, close_fds=False
+            )
+            if "com.usebottles.bottles" in result.stdout:
+                return _absolute_commands({
+                    "bottles_cli": ["flatpak", "run", "--command=bottles-cli", "com.usebottles.bottles"],
+                    "wine_cmd": ["flatpak", "run", "--command=wine", "com.usebottles.bottles"],
+                    "winetricks": ["flatpak", "run", "--command=winetricks", "com.usebottles.bottles"],
+                    "winedump": ["flatpak", "run", "--command=winedump", "com.usebottles.bottles"],
+                    "wineserver": ["flatpak", "run", "--command=wineserver", "com.usebottles.bottles"],
+                    "type": "flatpak"
+                })
+        except Exception:
+            pass
+
     if all(which(c) for c in ("bottles-cli", "wine", "winetricks", "wineserver")):
-        return {
+        return _absolute_commands({
             "bottles_cli": ["bottles-cli"],
             "wine_cmd": ["wine"],
             "winetricks": ["winetricks"],
             "winedump": ["winedump"],
             "wineserver": ["wineserver"],
             "type": "native"
-        }
+        })
     raise RuntimeError("No Bottles installation (Flatpak or native) found.")
 
-CMD = detect_bottles_commands()
-BOTTLES_CLI = CMD["bottles_cli"]
-WINE_CMD = CMD["wine_cmd"]
-WINETRICKS = CMD["winetricks"]
-WINEDUMP = CMD["winedump"]
-WINESERVER = CMD["wineserver"]
-INSTALL_TYPE = CMD["type"]
+@lru_cache(maxsize=1)
+def detect_bottles_commands() -> Dict[str, Any]:
+    key = _flatpak_key()
+    commands = _load_cache(key)
+    if commands is None:
+        commands = _probe_bottles_commands(has_flatpak=key != "none")
+        _save_cache(key, commands)
+    # Command prefixes are fixed for the life of the process: keep them as tuples
+    # and unpack them into each argv
+    return {k: tuple(v) if isinstance(v, list) else v for k, v in commands.items()}
 
-PREFIX_BASE = "/mnt/data"
+def _cmd(key: str) -> Tuple[str, ...]:
+    return detect_bottles_commands()[key]
 
+# Module attributes resolved on first use (PEP 562), so importing this module
+# does not probe the system
+_CMD_ATTRS = {
+    "BOTTLES_CLI": "bottles_cli",
+    "WINE_CMD": "wine_cmd",
+    "WINETRICKS": "winetricks",
+    "WINEDUMP": "winedump",
+    "WINESERVER": "wineserver",
+    "INSTALL_TYPE": "type",
+}
 
+def __getattr__(name: str):
+    if name == "CMD":
+        return detect_bottles_commands()
+    if name in _CMD_ATTRS:
+        return detect_bottles_commands()[_CMD_ATTRS[name]]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def map_dll(dll: str) -> Optional[str]:
-    return DLL_MAP.get(dll.lower())
+PREFIX_BASE = "/mnt/data"
 
 def prefix_path(name: str) -> Path:
     """Converts bottle name to a filesystem-safe path (replaces spaces with dashes)."""
     safe_name = name.replace(" ", "-")
     return Path(PREFIX_BASE) / safe_name
 
+# Environment snapshot taken once; subprocesses get a merged copy instead of os.environ.copy()
+_BASE_ENV = os.environ.copy()
+
+def _wine_env(bottle: str, **extra: str) -> Dict[str, str]:
+    """Environment for a Wine tool running inside the bottle's prefix."""
+    return {**_BASE_ENV, "WINEPREFIX": str(prefix_path(bottle)), **extra}
+
+# ------------------------------------------------------------------
+# Flatpak Sandbox Session
+# ------------------------------------------------------------------
+class FlatpakSession:
+    """
+    One long-lived bash inside the Bottles Flatpak sandbox.
+
+    Every `flatpak run` builds a new bubblewrap sandbox (namespaces, seccomp filter,
+    mounts) before the tool even starts. Commands sent to this shell reuse its sandbox;
+    their output (stdout and stderr combined) ends with a marker line carrying the
+    exit code. One command runs at a time.
+    """
+
+    def __init__(self, app: str = "com.usebottles.bottles"):
+        self._app = app
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def try_run(self, argv: List[str], env: Dict[str, str], timeout: float) -> Optional[subprocess.CompletedProcess]:
+        """
+        Runs `argv` in the session with `env` added to its environment.
+
+        Returns:
+            Optional[subprocess.CompletedProcess]: The result, or None if the session is
+            busy with another command (the caller then starts its own process).
+
+        Raises:
+            subprocess.TimeoutExpired: The command did not finish in time; the session is restarted.
+            OSError: The session could not be started or died.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._run(argv, env, timeout)
+        finally:
+            self._lock.release()
+
+    def _run(self, argv: List[str], env: Dict[str, str], timeout: float) -> subprocess.CompletedProcess:
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                ["flatpak", "run", "--command=bash", self._app, "-s"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                close_fds=False, start_new_session=True
+            )
+        marker = f"__sysopt_done_{uuid.uuid4().hex}__"
+        assignments = " ".join(f"{k}={shlex.quote(v)}" for k, v in env.items())
+        script = f"env {assignments} {shlex.join(argv)} </dev/null 2>&1; printf '\\n%s:%d\\n' {marker} \"$?\"\n"
+        try:
+            self._proc.stdin.write(script.encode())
+            self._proc.stdin.flush()
+        except BrokenPipeError as e:
+            self.close()
+            raise OSError("Flatpak session exited") from e
+
+        tag = f"\n{marker}:".encode()
+        buf = bytearray()
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._proc.stdout, selectors.EVENT_READ)
+            while True:
+                end = buf.find(tag)
+                code_end = buf.find(b"\n", end + len(tag)) if end != -1 else -1
+                if code_end != -1:
+                    returncode = int(buf[end + len(tag):code_end])
+                    output = bytes(buf[:end])
+                    return subprocess.CompletedProcess(argv, returncode, stdout=output, stderr=output)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close()
+                    raise subprocess.TimeoutExpired(argv, timeout)
+                if not selector.select(remaining):
+                    continue
+                chunk = os.read(self._proc.stdout.fileno(), 65536)
+                if not chunk:
+                    self.close()
+                    raise OSError("Flatpak session exited")
+                buf += chunk
+
+    def close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        if proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        proc.wait()
+
+_FLATPAK_SESSION = FlatpakSession()
+atexit.register(_FLATPAK_SESSION.close)
+
+def _run_wine_tool(bottle: str, tool: str, args: List[str], timeout: float) -> subprocess.CompletedProcess:
+    """
+    Runs winetricks / wineserver for a bottle and captures its output as bytes.
+    Flatpak installs go through the shared sandbox session when it is free.
+    """
+    if detect_bottles_commands()["type"] == "flatpak":
+        try:
+            result = _FLATPAK_SESSION.try_run([tool, *args], {"WINEPREFIX": str(prefix_path(bottle))}, timeout)
+        except OSError:
+            result = None
+        if result is not None:
+            return result
+    return subprocess.run(
+        [*_cmd(tool), *args],
+        env=_wine_env(bottle), capture_output=True, timeout=timeout, close_fds=False
+    )
+
 # ------------------------------------------------------------------
 # Global Status Tracker 
 # ------------------------------------------------------------------
+# Console output of log_status: the caller only enqueues the record, a listener
+# thread does the formatting and writing
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_console = logging.StreamHandler(sys.stdout)
+_console.setFormatter(logging.Formatter("[STATUS] %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _console)
+_log_listener.start()
+# Flush what is still queued on exit
+atexit.register(_log_listener.stop)
+
+# Log lines kept per bottle; older ones are dropped
+STATUS_LOG_LINES = 500
+
 BOTTLE_STATUS: Dict[str, dict] = defaultdict(lambda: {
     "status": "idle",
-    "log": [],
+    "log": deque(maxlen=STATUS_LOG_LINES),
     "candidates": [],
     "subpath": None  # <-- NEU: merkt sich den relevanten Unterordner
 })
 
+# strftime result for the current second, shared by all log lines within it
+_timestamp_cache = (0, "")
+
+def _timestamp() -> str:
+    global _timestamp_cache
+    now = int(time.time())
+    second, text = _timestamp_cache
+    if second != now:
+        text = time.strftime("%H:%M:%S", time.localtime(now))
+        _timestamp_cache = (now, text)
+    return text
+
 def log_status(bottle: str, message: str):
-    timestamp = time.strftime("%H:%M:%S")
+    timestamp = _timestamp()
     entry = f"[{timestamp}] {message}"
     BOTTLE_STATUS[bottle]["log"].append(entry)
     BOTTLE_STATUS[bottle]["status"] = "running"
-    print(f"[STATUS] {bottle}: {message}")
+    logger.info("%s: %s", bottle, message)
 
 # ------------------------------------------------------------------
 # Bottle Management
@@ -88,8 +332,8 @@ def create_bottle(name: str, timeout: int = 300) -> bool:
     log_status(name, f"create_bottle: {name}")
     try:
         subprocess.run(
-            BOTTLES_CLI + ["new", "--bottle-name", name, "--environment", "gaming"],
-            check=True, capture_output=True, text=True, timeout=timeout
+            [*_cmd("bottles_cli"), "new", "--bottle-name", name, "--environment", "gaming"],
+            check=True, capture_output=True, text=True, timeout=timeout, close_fds=False
         )
         return True
     except subprocess.CalledProcessError as e:
@@ -102,44 +346,150 @@ def create_bottle(name: str, timeout: int = 300) -> bool:
         log_status(name, f"[ERROR] create_bottle: {e}")
         return False
 
+# Dependencies installed as Bottles components (bottles-cli add) instead of winetricks verbs
+BOTTLES_COMPONENTS = {"dxvk", "vkd3d", "dxvk-nvapi"}
+
+ALREADY_INSTALLED = b"already installed"
+ALREADY_INSTALLED_SCAN = 8192
+
 def install_dep(bottle: str, dep: str) -> bool:
     log_status(bottle, f"install_dep: {dep} -> {bottle}")
-    bottles_comps = {"dxvk", "vkd3d", "dxvk-nvapi"}
-    env = os.environ.copy()
-    env["WINEPREFIX"] = str(prefix_path(bottle))
+    env = _wine_env(bottle)
     try:
-        if dep in bottles_comps:
-            cmd = BOTTLES_CLI + ["add", "-b", bottle, "-n", dep, "-p", "dummy"]
+        # Raw bytes: verbose verbs (dotnet*) print hundreds of KB that are never decoded
+        if dep in BOTTLES_COMPONENTS:
+            cmd = [*_cmd("bottles_cli"), "add", "-b", bottle, "-n", dep, "-p", "dummy"]
+            result = subprocess.run(cmd, env=env, capture_output=True, timeout=600, close_fds=False)
         else:
-            cmd = WINETRICKS + [dep]
-        result = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=600)
-        if result.returncode == 0 or "already installed" in result.stdout:
+            result = _run_wine_tool(bottle, "winetricks", [dep], timeout=600)
+        # winetricks reports an installed verb at the top of its output
+        if result.returncode == 0 or ALREADY_INSTALLED in result.stdout[:ALREADY_INSTALLED_SCAN]:
             log_status(bottle, f"  ✓ {dep}")
             return True
-        log_status(bottle, f"  ✗ {dep} – {result.stderr[:200]}")
+        log_status(bottle, f"  ✗ {dep} – {result.stderr[:200].decode(errors='replace')}")
         return False
     except Exception as e:
         log_status(bottle, f"[ERROR] install_dep: {e}")
         return False
 
-def wait_until_wineserver_idle(bottle: str):
-    env = os.environ.copy()
-    env["WINEPREFIX"] = str(prefix_path(bottle))
-    for _ in range(300):
+def _install_verbs_batch(bottle: str, verbs: List[str]) -> bool:
+    """
+    Runs several winetricks verbs in one invocation, which pays the winetricks
+    (and Flatpak sandbox) startup only once.
+    """
+    log_status(bottle, f"install_dep: {' '.join(verbs)} -> {bottle}")
+    try:
+        result = _run_wine_tool(bottle, "winetricks", verbs, timeout=600 * len(verbs))
+    except Exception as e:
+        log_status(bottle, f"[WARN] winetricks batch failed: {e}")
+        return False
+    if result.returncode == 0:
+        for verb in verbs:
+            log_status(bottle, f"  ✓ {verb}")
+        return True
+    log_status(bottle, f"[WARN] winetricks batch failed, retrying per verb – {result.stderr[:200].decode(errors='replace')}")
+    return False
+
+def install_deps(bottle: str, deps) -> Dict[str, bool]:
+    """
+    Installs several dependencies into a bottle.
+
+    Bottles components (bottles-cli add) are independent of winetricks, so they are
+    installed while the winetricks verbs run. The winetricks verbs all modify the same
+    prefix, so they run in a single winetricks call (falling back to one call per verb
+    if that fails).
+
+    Returns:
+        Dict[str, bool]: Success per dependency.
+    """
+    deps = sorted(set(deps))
+    components = [d for d in deps if d in BOTTLES_COMPONENTS]
+    verbs = [d for d in deps if d not in BOTTLES_COMPONENTS]
+
+    def install_verbs():
+        if len(verbs) > 1 and _install_verbs_batch(bottle, verbs):
+            return dict.fromkeys(verbs, True)
+        # Single verb, or the batch failed: install one by one to see which verb broke
+        return {verb: install_dep(bottle, verb) for verb in verbs}
+
+    results: Dict[str, bool] = {}
+    with ThreadPoolExecutor(max_workers=len(components) + 1) as executor:
+        comp_futures = {executor.submit(install_dep, bottle, comp): comp for comp in components}
+        verbs_future = executor.submit(install_verbs)
+        for future, comp in comp_futures.items():
+            results[comp] = future.result()
+        results.update(verbs_future.result())
+    return results
+
+def wait_until_wineserver_idle(bottle: str, timeout: int = 600):
+    # wineserver --wait blocks until the prefix is idle, so one call is enough
+    try:
+        _run_wine_tool(bottle, "wineserver", ["--wait"], timeout=timeout)
+    except subprocess.TimeoutExpired:
+        log_status(bottle, "[WARN] wineserver --wait timeout")
+
+def _is_empty_dir(path: Path) -> bool:
+    try:
+        with os.scandir(path) as it:
+            return next(it, None) is None
+    except NotADirectoryError:
+        return False
+
+def _copy_tree(src: str, dst: Path):
+    """
+    Copies a directory tree, sharing the data blocks where the filesystem allows it.
+
+    `cp --reflink=auto` clones extents on btrfs/xfs/zfs instead of copying the
+    bytes and silently copies normally elsewhere. Hardlinks are not used: the
+    game would then write into the original files.
+    """
+    if which("cp"):
         try:
-            subprocess.run(WINESERVER + ["--wait"], env=env, check=True, timeout=10)
+            subprocess.run(
+                ["cp", "--reflink=auto", "-a", "-T", "--", src, str(dst)],
+                check=True, capture_output=True, close_fds=False
+            )
+            return
+        except subprocess.CalledProcessError:
+            # Leave nothing half-copied behind for copytree
+            shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
+
+def link_or_copy_file(src: Path, dst: Path):
+    """
+    Puts a file at `dst` without copying its bytes where possible: a hardlink on the
+    same filesystem, else copy_file_range (which reflinks on btrfs/xfs), else a normal copy.
+    Only for files that are read, not written (e.g. installers): a hardlink shares the data.
+    """
+    # Never write through an existing (possibly hardlinked) target
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        if remaining <= 0:
+            shutil.copystat(src, dst)
             return
-        except subprocess.TimeoutExpired:
-            time.sleep(2)
-    log_status(bottle, "[WARN] wineserver --wait timeout")
+    except OSError:
+        pass
+    shutil.copy(src, dst)
 
 def copy_folder_to_bottle(bottle: str, src: str, target_subdir: str) -> bool:
     prefix = prefix_path(bottle) / "drive_c" / target_subdir
     prefix.parent.mkdir(parents=True, exist_ok=True)
     try:
-        if prefix.exists():
+        if prefix.exists() and not _is_empty_dir(prefix):
             shutil.rmtree(prefix)
-        shutil.copytree(src, prefix, symlinks=True)
+        _copy_tree(src, prefix)
         log_status(bottle, f"[MCP] copied {src} -> {prefix}")
         return True
     except Exception as e:
@@ -186,9 +536,13 @@ def create_shortcut_in_bottle(bottle: str, exe_path: Path):
             "icon": "com.usebottles.bottles-program"
         }
 
-        
-        with open(bottles_yaml, "w") as f:
+        # Write a temp file next to it and swap it in, so Bottles never reads a half-written bottle.yml
+        tmp_yaml = bottles_yaml.with_name(f".{bottles_yaml.name}.tmp")
+        with open(tmp_yaml, "w") as f:
             yaml.dump(data, f, default_flow_style=False, allow_unicode=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_yaml, bottles_yaml)
 
         log_status(bottle, f"[MCP] Created external shortcut: {exe_path.stem}")
         return True
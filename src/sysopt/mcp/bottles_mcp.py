@@ -11,13 +11,12 @@ Bottles-MCP-Server v5
 
 from __future__ import annotations
 
+import asyncio
 import os
 import subprocess
 import json
 import re
-import threading
 import time
-import shutil
 import difflib
 from pathlib import Path
 from typing import Optional, Set, List, Dict, Any
@@ -27,13 +26,15 @@ from collections import defaultdict
 from contextlib import contextmanager
 
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
 from .dll_map import DLL_MAP
-from .dep_scanner import scan_deps_static, scan_deps_wine
+from .dep_scanner import scan_deps
 
-from .bottles_handler import create_bottle, copy_folder_to_bottle, wait_until_wineserver_idle, install_dep, create_shortcut_in_bottle, log_status, BOTTLE_STATUS, prefix_path, WINE_CMD, WINEDUMP
-from .exe_handler import probe_pe_metadata, enumerate_and_score_exes
+from . import bottles_handler
+from .bottles_handler import create_bottle, copy_folder_to_bottle, link_or_copy_file, wait_until_wineserver_idle, install_deps, create_shortcut_in_bottle, log_status, BOTTLE_STATUS, prefix_path
+from .exe_handler import probe_pe_metadata, enumerate_and_score_exes, resolve_search_root
 from .iso_handler import find_setup_exe_in_iso, run_setup_in_bottle, mount_iso
 
 app = FastAPI()
@@ -45,22 +46,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ------------------------------------------------------------------
+# Background Jobs
+# ------------------------------------------------------------------
+# Installs and scans queue up here; at most JOB_WORKERS run at the same time,
+# each on a threadpool thread so the event loop stays free
+JOB_WORKERS = 4
+
+async def _job_worker(jobq: asyncio.Queue):
+    while True:
+        job = await jobq.get()
+        try:
+            await run_in_threadpool(job)
+        except Exception as e:
+            print(f"[MCP] Background job failed: {e}")
+        finally:
+            jobq.task_done()
+
+@app.on_event("startup")
+async def start_job_workers():
+    app.state.jobq = asyncio.Queue()
+    app.state.job_workers = [asyncio.create_task(_job_worker(app.state.jobq)) for _ in range(JOB_WORKERS)]
+
+# ------------------------------------------------------------------
+# Candidate Cache
+# ------------------------------------------------------------------
+# A scan is reused for this many seconds unless the search root changed
+CANDIDATES_TTL = 60
+
+def _scan_candidates(bottle: str, top_n: int, subpath: Optional[str] = None, reuse: bool = True) -> List[Dict[str, Any]]:
+    """
+    Scores the bottle's EXEs and stores them in BOTTLE_STATUS. With `reuse`, a scan of at
+    least `top_n` entries younger than CANDIDATES_TTL is returned as long as the search
+    root's mtime is unchanged.
+    """
+    data = BOTTLE_STATUS[bottle]
+    try:
+        root_mtime = resolve_search_root(bottle, subpath).stat().st_mtime_ns
+    except OSError:
+        root_mtime = None
+    cached = data.get("candidates")
+    if (
+        reuse and cached
+        and data.get("candidates_top_n", 0) >= top_n
+        and time.monotonic() - data.get("candidates_ts", float("-inf")) < CANDIDATES_TTL
+        and data.get("candidates_root_mtime") == root_mtime
+    ):
+        return cached[:top_n]
+
+    candidates = enumerate_and_score_exes(bottle, top_n=top_n, subpath=subpath)
+    data["candidates"] = candidates
+    data["candidates_ts"] = time.monotonic()
+    data["candidates_top_n"] = top_n
+    data["candidates_root_mtime"] = root_mtime
+    return candidates
+
 # ------------------------------------------------------------------
 # Endpoints
 # ------------------------------------------------------------------
-@app.get("/status/{bottle_name}")
-async def get_bottle_status(bottle_name: str):
-    data = BOTTLE_STATUS[bottle_name]
-    candidates = data.get("candidates", [])
-    candidates_short = [
-        {"path": c.get("path"), "score": c.get("score"), "product_name": c.get("product_name"), "size": c.get("size"), "mtime": c.get("mtime")}
+def _trim_candidates(candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"path": c["path"], "score": c["score"], "product_name": c.get("product_name", ""), "size": c.get("size"), "mtime": c.get("mtime")}
         for c in candidates
     ]
+
+@app.get("/status/{bottle_name}")
+async def get_bottle_status(bottle_name: str):
+    # .get(): polling an unknown bottle must not create an entry for it
+    data = BOTTLE_STATUS.get(bottle_name) or {}
+    candidates = data.get("candidates")
     return {
         "bottle": bottle_name,
         "status": data.get("status", "idle"),
-        "log": data.get("log", []),
-        "candidates": candidates_short
+        "log": list(data.get("log", ())),
+        "candidates": _trim_candidates(candidates) if candidates else []
     }
 
 @app.get("/candidates/{bottle_name}")
@@ -68,23 +127,16 @@ async def get_candidates(bottle_name: str):
     if not bottle_name:
         raise HTTPException(status_code=400, detail="bottle_name required")
 
-    subpath = BOTTLE_STATUS[bottle_name].get("subpath")
-    existing = BOTTLE_STATUS[bottle_name].get("candidates")
+    data = BOTTLE_STATUS[bottle_name]
+    existing = data.get("candidates")
     if existing:
-        trimmed = [
-            {"path": c["path"], "score": c["score"], "product_name": c.get("product_name", ""), "size": c.get("size"), "mtime": c.get("mtime")}
-            for c in existing
-        ]
-        return {"bottle": bottle_name, "candidates": trimmed}
-
-    candidates = enumerate_and_score_exes(bottle_name, top_n=10, subpath=subpath)
-    BOTTLE_STATUS[bottle_name]["candidates"] = candidates
+        return {"bottle": bottle_name, "candidates": _trim_candidates(existing)}
+
+    subpath = data.get("subpath")
+    # The scan walks the prefix and probes every EXE; keep it off the event loop
+    candidates = await asyncio.to_thread(_scan_candidates, bottle_name, 10, subpath)
     log_status(bottle_name, f"[MCP] Enumerated {len(candidates)} EXE candidates (subpath={subpath})")
-    trimmed = [
-        {"path": c["path"], "score": c["score"], "product_name": c.get("product_name", ""), "size": c.get("size"), "mtime": c.get("mtime")}
-        for c in candidates
-    ]
-    return {"bottle": bottle_name, "candidates": trimmed}
+    return {"bottle": bottle_name, "candidates": _trim_candidates(candidates)}
 
 @app.post("/agent/choose_exe")
 async def agent_choose_exe(payload: Request):
@@ -105,8 +157,8 @@ async def agent_choose_exe(payload: Request):
                     log_status(bottle, "[MCP] create_bottle failed")
                     return
 
-            candidates = enumerate_and_score_exes(bottle, top_n=50, subpath=BOTTLE_STATUS[bottle].get("subpath"))
-            BOTTLE_STATUS[bottle]["candidates"] = candidates
+            # Reuses a scan from just before (e.g. /candidates) instead of probing every EXE again
+            candidates = _scan_candidates(bottle, 50, BOTTLE_STATUS[bottle].get("subpath"))
 
             exe_p = Path(exe_path)
             if not exe_p.exists():
@@ -117,17 +169,13 @@ async def agent_choose_exe(payload: Request):
                 exe_p = matched
                 log_status(bottle, f"[MCP] Matched to: {exe_p}")
 
-            res = scan_deps_static(str(exe_p), winedump_cmd=WINEDUMP)
+            res = scan_deps(str(exe_p), wineprefix=str(prefix_path(bottle)), wine_cmd=bottles_handler.WINE_CMD, winedump_cmd=bottles_handler.WINEDUMP, timeout=20)
+            log_status(bottle, f"[MCP] Dependency scan via {res.get('source')}")
             deps = set(res.get("dependencies", []))
-            if not deps:
-                log_status(bottle, "[MCP] Static scan found no deps, falling back to wine runtime scan")
-                res2 = scan_deps_wine(program=str(exe_p), wineprefix=str(prefix_path(bottle)), wine_cmd=WINE_CMD, timeout=20)
-                deps = set(res2.get("dependencies", []))
 
             if deps:
                 log_status(bottle, f"[MCP] Installing {len(deps)} dependencies")
-                for d in sorted(deps):
-                    install_dep(bottle, d)
+                install_deps(bottle, deps)
             else:
                 log_status(bottle, "[MCP] No dependencies detected")
 
@@ -145,7 +193,7 @@ async def agent_choose_exe(payload: Request):
         except Exception as e:
             log_status(bottle, f"[FATAL] Exception in choose_exe: {e}")
 
-    threading.Thread(target=bg_scan, daemon=True).start()
+    await app.state.jobq.put(bg_scan)
     return {"status": "started", "bottle": bottle, "exe_path": exe_path, "create_shortcut": create_shortcut}
 
 # ------------------------------------------------------------------
@@ -238,23 +286,24 @@ async def handle(request: Request):
                                 return
                             actual_exe = str(setup_exe)
 
-                            res = scan_deps_wine(
+                            res = scan_deps(
                                 program=actual_exe,
                                 wineprefix=str(prefix_path(bottle)),
-                                wine_cmd=WINE_CMD,
+                                wine_cmd=bottles_handler.WINE_CMD,
+                                winedump_cmd=bottles_handler.WINEDUMP,
                                 timeout=10
                             )
-                            if not res["success"]:
-                                log_status(bottle, "[MCP] Falling back to static scan")
-                                res = scan_deps_static(program=actual_exe, winedump_cmd=WINEDUMP)
+                            log_status(bottle, f"[MCP] Dependency scan via {res.get('source')}")
 
-                            for dep in sorted(set(res.get("dependencies", []))):
-                                install_dep(bottle, dep)
+                            install_deps(bottle, res.get("dependencies", []))
 
                     else:
                         actual_exe = exe_input
-                        if not create_bottle(bottle):
-                            return
+                        if not prefix_path(bottle).exists():
+                            if not create_bottle(bottle):
+                                return
+                        else:
+                            log_status(bottle, f"[MCP] Using existing bottle: {bottle}")
 
                         exe_path = Path(actual_exe)
                         if not exe_path.is_relative_to(prefix_path(bottle)):
@@ -262,28 +311,25 @@ async def handle(request: Request):
                             temp_dest.mkdir(parents=True, exist_ok=True)
                             exe_name = exe_path.name
                             target_exe = temp_dest / exe_name
-                            shutil.copy(exe_path, target_exe)
+                            link_or_copy_file(exe_path, target_exe)
                             actual_exe = str(target_exe)
 
-                        res = scan_deps_wine(
+                        res = scan_deps(
                             program=actual_exe,
                             wineprefix=str(prefix_path(bottle)),
-                            wine_cmd=WINE_CMD,
+                            wine_cmd=bottles_handler.WINE_CMD,
+                            winedump_cmd=bottles_handler.WINEDUMP,
                             timeout=10
                         )
-                        if not res["success"]:
-                            log_status(bottle, "[MCP] Falling back to static scan")
-                            res = scan_deps_static(program=actual_exe, winedump_cmd=WINEDUMP)
+                        log_status(bottle, f"[MCP] Dependency scan via {res.get('source')}")
 
-                        for dep in sorted(set(res.get("dependencies", []))):
-                            install_dep(bottle, dep)
+                        install_deps(bottle, res.get("dependencies", []))
 
                     host_exe_path = Path(actual_exe)
                     log_status(bottle, f"[MCP] Running installer via Bottles: {host_exe_path}")
                     run_setup_in_bottle(bottle, host_exe_path)
 
-                    candidates = enumerate_and_score_exes(bottle, top_n=10)
-                    BOTTLE_STATUS[bottle]["candidates"] = candidates
+                    candidates = _scan_candidates(bottle, 10, reuse=False)
                     # Mark source as installer (not folder_installer)
                     BOTTLE_STATUS[bottle]["source"] = "installer"
                     log_status(bottle, f"[MCP] Found {len(candidates)} EXE candidates after install")
@@ -292,7 +338,7 @@ async def handle(request: Request):
                 except Exception as e:
                     log_status(bottle, f"[FATAL] Exception in background task: {e}")
 
-            threading.Thread(target=bg, daemon=True).start()
+            await app.state.jobq.put(bg)
             return {
                 "jsonrpc": "2.0",
                 "id": req_id,
@@ -328,14 +374,13 @@ async def handle(request: Request):
 
                     BOTTLE_STATUS[bottle]["subpath"] = target_subdir
                     BOTTLE_STATUS[bottle]["source"] = "folder_installer"  # Mark source as folder installer
-                    candidates = enumerate_and_score_exes(bottle, top_n=10, subpath=target_subdir)
-                    BOTTLE_STATUS[bottle]["candidates"] = candidates
+                    candidates = _scan_candidates(bottle, 10, target_subdir, reuse=False)
                     log_status(bottle, f"[MCP] Found {len(candidates)} EXE candidates after folder copy")
 
                 except Exception as e:
                     log_status(bottle, f"[FATAL] Exception in bottles_folder_installer: {e}")
 
-            threading.Thread(target=bg, daemon=True).start()
+            await app.state.jobq.put(bg)
             return {
                 "jsonrpc": "2.0",
                 "id": req_id,
@@ -356,7 +401,7 @@ async def root():
     return {
         "name": "BottleAutomator",
         "version": "5.0.0",
-        "installation_type": INSTALL_TYPE,
+        "installation_type": bottles_handler.INSTALL_TYPE,
         "status": "ready"
     }
 
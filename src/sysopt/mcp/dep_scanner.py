@@ -1,59 +1,117 @@
 import os
 import subprocess
 import re
-from typing import Dict, Any, List
+import signal
+import tempfile
+import threading
+import time
+from typing import Dict, Any, Optional, Sequence, Set, Tuple
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
 from pathlib import Path
 
 
 from .dll_map import DLL_MAP
 
-def map_dll(dll: str) -> str | None:
-    return DLL_MAP.get(dll.lower())
+# Environment snapshot taken once; each scan merges its overrides into a copy
+_BASE_ENV = os.environ.copy()
 
 # ------------------------------------------------------------------
 # Dependency Scan (Wine Debug)
 # ------------------------------------------------------------------
+# DLL names in Wine's +loaddll / err:module output; "missing" marks load failures
+_WINE_DLL_RE = re.compile(
+    r"(?:(?P<loaded>load(?:ed)?\s+library\s+|Loaded module\s+)"
+    r"|(?P<missing>err:module:.*?\s+|Could not load\s+|failed to (?:open|load).*?))"
+    r"['\"]?(?P<dll>[^\s]+\.dll)",
+    re.I,
+)
+# Seconds without a newly seen DLL after which the wine scan stops early
+WINE_SCAN_SETTLE = 2.0
+
 def scan_deps_wine(
     program: str,
     wineprefix: str,
-    wine_cmd: List[str],
-    timeout: int = 10
+    wine_cmd: Sequence[str],
+    timeout: int = 10,
+    stop: Optional[threading.Event] = None,
+    expected_dlls: Optional[Future] = None
 ) -> Dict[str, Any]:
+    """
+    Runs the program under Wine with +loaddll and collects the DLLs it loads or misses.
+    Setting `stop` ends the scan early (the process is killed).
+    `expected_dlls` may resolve to the lower-cased DLL names from the static import
+    table (or None); once Wine has loaded or missed all of them, the scan ends.
+    """
     if not os.path.isfile(program):
         return {"success": False, "error": "file not found"}
-    env = os.environ.copy()
-    env["WINEPREFIX"] = wineprefix
-    env["WINEDEBUG"] = "+loaddll"
-    env["LIBGL_ALWAYS_SOFTWARE"] = "1"
-    env["GALLIUM_DRIVER"] = "llvmpipe"
+    env = {
+        **_BASE_ENV,
+        "WINEPREFIX": wineprefix,
+        "WINEDEBUG": "+loaddll",
+        "LIBGL_ALWAYS_SOFTWARE": "1",
+        "GALLIUM_DRIVER": "llvmpipe",
+    }
     try:
         proc = subprocess.Popen(
-            wine_cmd + [program],
+            [*wine_cmd, program],
             env=env,
-            stdout=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE,
-            text=True
+            text=True,
+            errors="replace",
+            bufsize=1,
+            close_fds=False,
+            # Own process group, so wine's children are killed with it
+            start_new_session=True
         )
+        loaded, missing, deps = set(), set(), set()
+        # Bare file names of every DLL seen, as winedump reports imports without a path
+        seen: Set[str] = set()
+        last_new = [time.monotonic()]
+        finished = threading.Event()
+
+        def read_stderr():
+            # Parse line by line while wine runs; nothing is buffered beyond one line
+            for line in proc.stderr:
+                for m in _WINE_DLL_RE.finditer(line):
+                    dll = m.group("dll").lower()
+                    target = missing if m.group("missing") else loaded
+                    if dll not in target:
+                        target.add(dll)
+                        seen.add(dll.replace("\\", "/").rsplit("/", 1)[-1])
+                        last_new[0] = time.monotonic()
+                        # Map only newly seen DLLs
+                        comp = DLL_MAP.get(dll)
+                        if comp is not None and comp not in deps:
+                            deps.add(comp)
+            finished.set()
+
+        reader = threading.Thread(target=read_stderr, daemon=True)
+        reader.start()
+        deadline = time.monotonic() + timeout
         try:
-            _, stderr = proc.communicate(timeout=timeout)
-        except subprocess.TimeoutExpired:
-            proc.kill()
-            _, stderr = proc.communicate()
-        loaded, missing = set(), set()
-        patterns = [
-            r"load(?:ed)?\s+library\s+['\"]?([^\s]+\.dll)['\"]?",
-            r"Loaded module\s+['\"]?([^\s]+\.dll)['\"]?",
-            r"err:module:.*?\s+['\"]?([^\s]+\.dll)['\"]?",
-            r"Could not load\s+['\"]?([^\s]+\.dll)['\"]?",
-            r"failed to (?:open|load).*?['\"]?([^\s]+\.dll)['\"]?",
-        ]
-        for pat in patterns:
-            for dll in re.findall(pat, stderr, re.I):
-                if "err" in pat or "fail" in pat:
-                    missing.add(dll)
-                else:
-                    loaded.add(dll)
-        deps = {map_dll(d) for d in loaded | missing} - {None}
+            while not finished.wait(0.25):
+                now = time.monotonic()
+                if now >= deadline or (stop is not None and stop.is_set()):
+                    break
+                # Imports are resolved at startup; once no new DLL shows up for a while we are done
+                if (loaded or missing) and now - last_new[0] >= WINE_SCAN_SETTLE:
+                    break
+                # Every DLL the import table names has been resolved (or failed)
+                if expected_dlls is not None and expected_dlls.done():
+                    wanted = expected_dlls.result()
+                    if wanted and wanted.issubset(seen):
+                        break
+        finally:
+            if proc.poll() is None:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            proc.wait()
+            reader.join(timeout=2)
+
         return {
             "success": True,
             "dependencies": sorted(deps),
@@ -65,22 +123,139 @@ def scan_deps_wine(
 # ------------------------------------------------------------------
 # Static PE Scan
 # ------------------------------------------------------------------
-def scan_deps_static(program: str, winedump_cmd: List[str]) -> Dict[str, Any]:
+_WINEDUMP_DLL_RE = re.compile(r"DLL Name:\s+([^\s]+\.dll)", re.I)
+
+def scan_deps_static(program: str, winedump_cmd: Sequence[str]) -> Dict[str, Any]:
     try:
-        result = subprocess.run(
-            winedump_cmd + ["-j", program],
-            capture_output=True,
+        st = os.stat(program)
+        # The same EXE is often scanned again (retries, several bottles); an unchanged
+        # file (same size and mtime) reuses the previous winedump result
+        result = _scan_deps_static(program, st.st_size, st.st_mtime_ns, tuple(winedump_cmd))
+        # Copies, so callers cannot change the cached lists
+        return {**result, "dependencies": list(result["dependencies"]), "dlls": list(result["dlls"])}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@lru_cache(maxsize=256)
+def _scan_deps_static(program: str, size: int, mtime_ns: int, winedump_cmd: Tuple[str, ...]) -> Dict[str, Any]:
+    # Raises on failure, so failed scans are not cached.
+    # stdout is parsed line by line while winedump runs instead of being buffered whole;
+    # stderr goes to a temp file so a chatty stderr cannot block the pipe
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(
+            [*winedump_cmd, "-j", program],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
             text=True,
-            timeout=30
+            errors="replace",
+            close_fds=False,
+            # Own process group: a child left behind by a killed wrapper (flatpak)
+            # would otherwise keep stdout open
+            start_new_session=True
         )
-        if result.returncode != 0:
-            raise RuntimeError(result.stderr)
-        dlls = re.findall(r"(?i)DLL Name:\s+([^\s]+\.dll)", result.stdout)
-        deps = {map_dll(d) for d in dlls} - {None}
-        return {
-            "success": True,
-            "dependencies": sorted(deps),
-            "dlls": dlls
-        }
-    except Exception as e:
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+        watchdog = threading.Timer(30, kill)
+        watchdog.start()
+        dlls = []
+        names = set()
+        try:
+            # Collect raw and lower-cased names in the same pass over the import table
+            for line in proc.stdout:
+                m = _WINEDUMP_DLL_RE.search(line)
+                if m:
+                    dll = m.group(1)
+                    dlls.append(dll)
+                    names.add(dll.lower())
+            returncode = proc.wait()
+        finally:
+            watchdog.cancel()
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(proc.args, 30)
+        if returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(stderr.read().decode(errors="replace"))
+    # Map each distinct DLL once; most imports (kernel32, user32, ...) are not in DLL_MAP
+    deps = {DLL_MAP[d] for d in names if d in DLL_MAP}
+    return {
+        "success": True,
+        "dependencies": sorted(deps),
+        "dlls": dlls
+    }
+
+
+# ------------------------------------------------------------------
+# Combined Scan
+# ------------------------------------------------------------------
+# Once the static scan finds one of these, the program's runtime is known well
+# enough that booting it under Wine is not worth the wait
+ESSENTIAL_DEPS = frozenset({"dxvk", "vkd3d", "vcrun2019", "vcrun2022"})
+# Seconds the static scan may take before the Wine scan is started alongside it
+STATIC_HEAD_START = 0.5
+
+def scan_deps(
+    program: str,
+    wineprefix: str,
+    wine_cmd: Sequence[str],
+    winedump_cmd: Sequence[str],
+    timeout: int = 10
+) -> Dict[str, Any]:
+    """
+    Runs the static PE scan and the Wine runtime scan side by side.
+
+    The static scan (winedump, usually cached) gets a short head start; if it finds one
+    of ESSENTIAL_DEPS by then, Wine is never started. Otherwise both run at the same
+    time, and Wine is stopped as soon as the static result makes it unnecessary.
+    When both finish, their dependencies are merged.
+
+    Returns:
+        Dict[str, Any]: Like the single scans, plus "source" ("static", "wine" or "static+wine").
+    """
+    def essential(result: Dict[str, Any]) -> bool:
+        return result["success"] and not ESSENTIAL_DEPS.isdisjoint(result["dependencies"])
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        static_future = executor.submit(scan_deps_static, program, winedump_cmd)
+        try:
+            static = static_future.result(timeout=STATIC_HEAD_START)
+        except FuturesTimeout:
+            static = None
+        if static is not None and essential(static):
+            return {**static, "source": "static"}
+
+        stop = threading.Event()
+        # Filled in once the static scan is done, so Wine can stop when it has seen every import
+        imports: Future = Future()
+        wine_future = executor.submit(
+            scan_deps_wine, program=program, wineprefix=wineprefix, wine_cmd=wine_cmd, timeout=timeout,
+            stop=stop, expected_dlls=imports
+        )
+        if static is None:
+            static = static_future.result()
+        imports.set_result({d.lower() for d in static["dlls"]} if static["success"] else None)
+        if essential(static):
+            stop.set()
+            return {**static, "source": "static"}
+        wine = wine_future.result()
+
+    if not wine["success"]:
+        return {**static, "source": "static"}
+    if not static["success"]:
+        return {**wine, "source": "wine"}
+    return {
+        **wine,
+        "dependencies": sorted(set(static["dependencies"]) | set(wine["dependencies"])),
+        "dlls": static["dlls"],
+        "source": "static+wine"
+    }
@@ -64,4 +64,5 @@ DLL_MAP: dict[str, str] = {
 }
 
 def map_dll(dll: str) -> Optional[str]:
+    """Winetricks verb / Bottles component for a DLL name (any case), or None."""
     return DLL_MAP.get(dll.lower())
\ No newline at end of file
@@ -3,38 +3,177 @@ from __future__ import annotations
 import os
 import subprocess
 import re
+import struct
 import time
 import difflib
+import itertools
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
+try:
+    # C++ implementation; difflib is the pure-Python fallback
+    from rapidfuzz.fuzz import ratio as _fuzz_ratio
+except ImportError:
+    _fuzz_ratio = None
 
-from .bottles_handler import log_status, WINEDUMP, prefix_path
+from . import bottles_handler
+from .bottles_handler import log_status, prefix_path
 
 # ------------------------------------------------------------------
 # EXE Metadata & Scoring (now supports subpath)
 # ------------------------------------------------------------------
-def probe_pe_metadata(exe_path: Path) -> Dict[str, str]:
-    product_name = ""
-    file_version = ""
+_RT_VERSION = 16
+_PE_SUBDIR = 0x80000000
+# Upper bound for a VS_VERSIONINFO block; real ones are a few KB
+_MAX_VERSION_INFO = 64 * 1024
+
+def _read_pe_version_strings(exe_path: Path) -> Optional[Dict[str, str]]:
+    """
+    Reads ProductName / FileVersion from the VS_VERSIONINFO resource of a PE file.
+
+    Only the headers, the resource directory entries on the way and the version block
+    itself are read, instead of handing the whole binary to winedump.
+
+    Returns:
+        Optional[Dict[str, str]]: The strings (empty if the file has no version
+        resource), or None if the file could not be parsed.
+    """
     try:
-        cmd = WINEDUMP + ["-jv", str(exe_path)]
-        res = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
-        out = (res.stdout or "") + "\n" + (res.stderr or "")
-        m = re.search(r"ProductName[:=]\s*(.+)", out, re.IGNORECASE)
-        if m:
-            product_name = m.group(1).strip().strip('"')
-        m2 = re.search(r"FileVersion[:=]\s*(.+)", out, re.IGNORECASE)
-        if m2:
-            file_version = m2.group(1).strip().strip('"')
+        with open(exe_path, "rb") as f:
+            dos = f.read(64)
+            if len(dos) < 64 or dos[:2] != b"MZ":
+                return None
+            f.seek(struct.unpack_from("<I", dos, 0x3C)[0])
+            coff = f.read(24)
+            if len(coff) < 24 or coff[:4] != b"PE\0\0":
+                return None
+            num_sections, = struct.unpack_from("<H", coff, 6)
+            optional_size, = struct.unpack_from("<H", coff, 20)
+            optional = f.read(optional_size)
+            # Data directories start after the PE32 / PE32+ specific fields; #2 is the resource table
+            magic, = struct.unpack_from("<H", optional, 0)
+            dirs_offset = {0x10B: 96, 0x20B: 112}.get(magic)
+            if dirs_offset is None or len(optional) < dirs_offset + 24:
+                return None
+            rsrc_rva, _ = struct.unpack_from("<II", optional, dirs_offset + 16)
+            if not rsrc_rva:
+                return {}
+
+            section_table = f.read(40 * num_sections)
+            for i in range(len(section_table) // 40):
+                virtual_size, virtual_address, raw_size, raw_pointer = struct.unpack_from("<IIII", section_table, 40 * i + 8)
+                if virtual_address <= rsrc_rva < virtual_address + max(virtual_size, raw_size):
+                    break
+            else:
+                return None
+
+            def read_rva(rva: int, size: int) -> bytes:
+                f.seek(raw_pointer + rva - virtual_address)
+                return f.read(size)
+
+            def first_entry(directory_offset: int, wanted_id: Optional[int] = None) -> Optional[int]:
+                header = read_rva(rsrc_rva + directory_offset, 16)
+                if len(header) < 16:
+                    return None
+                named, ids = struct.unpack_from("<HH", header, 12)
+                entries = read_rva(rsrc_rva + directory_offset + 16, 8 * (named + ids))
+                for i in range(len(entries) // 8):
+                    name, target = struct.unpack_from("<II", entries, 8 * i)
+                    if wanted_id is None or name == wanted_id:
+                        return target
+                return None
+
+            # Resource tree: type (RT_VERSION) -> name -> language -> data entry
+            target = first_entry(0, _RT_VERSION)
+            for _ in range(2):
+                if target is None or not target & _PE_SUBDIR:
+                    return {}
+                target = first_entry(target & ~_PE_SUBDIR)
+            if target is None or target & _PE_SUBDIR:
+                return {}
+            data_entry = read_rva(rsrc_rva + target, 8)
+            if len(data_entry) < 8:
+                return None
+            data_rva, data_size = struct.unpack_from("<II", data_entry)
+            block = read_rva(data_rva, min(data_size, _MAX_VERSION_INFO))
+    except (OSError, struct.error):
+        return None
+
+    return {
+        "product_name": _version_string(block, "ProductName"),
+        "file_version": _version_string(block, "FileVersion")
+    }
+
+def _version_string(block: bytes, key: str) -> str:
+    """Value of a String entry in a VS_VERSIONINFO block (UTF-16LE, DWORD-aligned)."""
+    needle = (key + "\0").encode("utf-16-le")
+    i = block.find(needle)
+    while i != -1 and i % 2:
+        i = block.find(needle, i + 1)
+    if i == -1:
+        return ""
+    start = (i + len(needle) + 3) & ~3
+    end = start
+    while end + 1 < len(block) and block[end:end + 2] != b"\0\0":
+        end += 2
+    return block[start:end].decode("utf-16-le", errors="replace").strip()
+
+def probe_pe_metadata(exe_path: Path, stat: Optional[os.stat_result] = None) -> Dict[str, str]:
+    """
+    ProductName / FileVersion of an EXE. Results are cached per (path, size, mtime),
+    so re-scans of an unchanged bottle start no winedump or strings processes.
+    `stat` may be passed when the caller already has it.
+    """
+    try:
+        st = stat or os.stat(exe_path)
+    except OSError:
+        return {"product_name": "", "file_version": ""}
+    return dict(_probe_pe_metadata(str(exe_path), st.st_size, st.st_mtime_ns))
+
+# One pass finds both keys; the key group tells them apart
+_VERSION_STRING_RE = re.compile(r"(?P<key>ProductName|FileVersion)[:=]\s*(?P<value>.+)", re.IGNORECASE)
+
+# Runs of printable ASCII (plus tab) of at least 4 bytes, like `strings` prints them
+_PRINTABLE_RUN_RE = re.compile(rb"[\t\x20-\x7e]{4,}")
+STRINGS_SCAN_BYTES = 256 * 1024
+
+def _winedump_version_strings(exe_path: str) -> Tuple[str, str]:
+    found: Dict[str, str] = {}
+    try:
+        cmd = [*bottles_handler.WINEDUMP, "-jv", str(exe_path)]
+        res = subprocess.run(cmd, capture_output=True, text=True, timeout=15, close_fds=False)
+        # stdout first, then stderr; the first occurrence of each key wins
+        for out in (res.stdout or "", res.stderr or ""):
+            for m in _VERSION_STRING_RE.finditer(out):
+                found.setdefault(m.group("key").lower(), m.group("value").strip().strip('"'))
+                if len(found) == 2:
+                    break
+            if len(found) == 2:
+                break
     except Exception:
         pass
+    product_name, file_version = found.get("productname", ""), found.get("fileversion", "")
+    return product_name, file_version
+
+@lru_cache(maxsize=4096)
+def _probe_pe_metadata(exe_path: str, size: int, mtime_ns: int) -> Dict[str, str]:
+    version = _read_pe_version_strings(Path(exe_path))
+    if version is not None:
+        product_name = version.get("product_name", "")
+        file_version = version.get("file_version", "")
+    else:
+        # Not parseable in-process: let winedump try
+        product_name, file_version = _winedump_version_strings(exe_path)
 
     if not product_name:
         try:
-            res2 = subprocess.run(["strings", str(exe_path)], capture_output=True, text=True, timeout=8)
-            lines = res2.stdout.splitlines()
-            for ln in lines[:400]:
+            # Same as the first lines of `strings`, without the process or reading the whole file
+            with open(exe_path, "rb") as fh:
+                head = fh.read(STRINGS_SCAN_BYTES)
+            lines = (m.group().decode("ascii") for m in _PRINTABLE_RUN_RE.finditer(head))
+            for ln in itertools.islice(lines, 400):
                 ln = ln.strip()
                 if 3 <= len(ln) <= 64 and any(c.isalpha() for c in ln) and not ln.lower().startswith("c:\\"):
                     product_name = ln
@@ -44,6 +183,45 @@ def probe_pe_metadata(exe_path: Path) -> Dict[str, str]:
 
     return {"product_name": product_name, "file_version": file_version}
 
+def _scan_tree(top: str):
+    """
+    Like os.walk(top), but each directory is read with a single os.scandir call and
+    files are yielded as DirEntry objects, whose type (and stat once fetched) is cached.
+    Subdirectories removed from `dirs` by the caller are not entered.
+    """
+    stack = [top]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        dirs = [e.name for e in entries if e.is_dir(follow_symlinks=False)]
+        files = [e for e in entries if not e.is_dir()]
+        yield root, dirs, files
+        stack.extend(os.path.join(root, d) for d in reversed(dirs))
+
+def _similarity(a: str, b: str) -> float:
+    """Similarity of two strings between 0.0 and 1.0."""
+    if _fuzz_ratio is not None:
+        return _fuzz_ratio(a, b) / 100.0
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+# EXE metadata probes running at the same time (file reads / winedump fallbacks)
+PROBE_WORKERS = 8
+# Smaller EXEs (launcher stubs, helpers) are scored on name, size and age only
+PROBE_MIN_SIZE = 512 * 1024
+_NO_METADATA = {"product_name": "", "file_version": ""}
+
+def resolve_search_root(bottle: str, subpath: Optional[str] = None) -> Path:
+    """Directory the EXE scan starts in: drive_c/<subpath>, else drive_c (the full prefix if <subpath> is missing)."""
+    prefix = prefix_path(bottle)
+    if subpath:
+        search_root = prefix / "drive_c" / subpath
+        return search_root if search_root.exists() else prefix
+    return prefix / "drive_c"
+
 def enumerate_and_score_exes(bottle: str, top_n: int = 10, subpath: Optional[str] = None) -> List[Dict[str, Any]]:
     prefix = prefix_path(bottle)
     if not prefix.exists():
@@ -51,13 +229,9 @@ def enumerate_and_score_exes(bottle: str, top_n: int = 10, subpath: Optional[str
         return []
 
     # set root for prefix
-    if subpath:
-        search_root = prefix / "drive_c" / subpath
-        if not search_root.exists():
-            log_status(bottle, f"[WARN] Subpath '{subpath}' does not exist. Scanning full prefix.")
-            search_root = prefix
-    else:
-        search_root = prefix / "drive_c" #fallback
+    search_root = resolve_search_root(bottle, subpath)
+    if subpath and search_root == prefix:
+        log_status(bottle, f"[WARN] Subpath '{subpath}' does not exist. Scanning full prefix.")
 
     log_status(bottle, f"[DEBUG] Scanning for EXEs in: {search_root}")
 
@@ -68,14 +242,19 @@ def enumerate_and_score_exes(bottle: str, top_n: int = 10, subpath: Optional[str
     }
     folder_hint = Path(subpath).name.lower() if subpath else bottle.lower().replace("-", "").replace("_", "").replace(" ", "")
 
-    candidates = []
+    found = []
     found_exe_count = 0
 
-    for root, dirs, files in os.walk(search_root):
-        if any(ex in root.lower() for ex in exclude_dirs):
-            log_status(bottle, f"[DEBUG] Skipping excluded dir: {root}")
-            continue
-        for f in files:
+    for root, dirs, files in _scan_tree(str(search_root)):
+        # Prune in place so excluded trees are never entered. A directory is excluded
+        # when its name contains an exclude word, so "Windows NT" and "Windows Media
+        # Player" under Program Files go along with windows/system32
+        kept = [d for d in dirs if not any(ex in d.lower() for ex in exclude_dirs)]
+        if len(kept) != len(dirs):
+            log_status(bottle, f"[DEBUG] Skipping excluded dirs in {root}: {sorted(set(dirs) - set(kept))}")
+            dirs[:] = kept
+        for entry in files:
+            f = entry.name
             if not f.lower().endswith(".exe"):
                 continue
             found_exe_count += 1
@@ -86,48 +265,57 @@ def enumerate_and_score_exes(bottle: str, top_n: int = 10, subpath: Optional[str
                 log_status(bottle, f"[DEBUG] Skipping (excluded keyword): {f}")
                 continue
 
-            p = Path(root) / f
             try:
-                stat = p.stat()
-            except Exception:
+                stat = entry.stat()
+            except OSError:
                 continue
-            size = stat.st_size
-            mtime = stat.st_mtime
-
-            meta = probe_pe_metadata(p)
-            prod_name = (meta.get("product_name") or "").strip()
-            file_version = meta.get("file_version") or ""
-
-            sim_name = difflib.SequenceMatcher(None, folder_hint, name_noext.replace(" ", "")).ratio()
-            sim_prod = 0.0
-            if prod_name:
-                sim_prod = difflib.SequenceMatcher(None, folder_hint, prod_name.lower().replace(" ", "")).ratio()
-
-            score = 0
-            score += int(sim_name * 40)
-            score += int(sim_prod * 30)
-            if any(sub in root.lower() for sub in ("bin", "binaries", "win64", "win32", "program files")):
-                score += 10
-            if size > 2 * 1024 * 1024:
-                score += 6
-            if size > 20 * 1024 * 1024:
-                score += 4
-            age_days = (time.time() - mtime) / (60 * 60 * 24)
-            if age_days < 30:
-                score += 3
-            elif age_days < 180:
-                score += 1
-
-            candidates.append({
-                "path": str(p),
-                "score": score,
-                "sim_name": round(sim_name, 3),
-                "sim_prod": round(sim_prod, 3),
-                "product_name": prod_name,
-                "file_version": file_version,
-                "size": size,
-                "mtime": mtime
-            })
+            found.append((root, Path(entry.path), name_noext, stat))
+
+    # Probe all EXEs concurrently, then score them
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+        metas = list(executor.map(
+            lambda c: probe_pe_metadata(c[1], c[3]) if c[3].st_size >= PROBE_MIN_SIZE else _NO_METADATA,
+            found
+        ))
+
+    candidates = []
+    for (root, p, name_noext, stat), meta in zip(found, metas):
+        size = stat.st_size
+        mtime = stat.st_mtime
+
+        prod_name = (meta.get("product_name") or "").strip()
+        file_version = meta.get("file_version") or ""
+
+        sim_name = _similarity(folder_hint, name_noext.replace(" ", ""))
+        sim_prod = 0.0
+        if prod_name:
+            sim_prod = _similarity(folder_hint, prod_name.lower().replace(" ", ""))
+
+        score = 0
+        score += int(sim_name * 40)
+        score += int(sim_prod * 30)
+        if any(sub in root.lower() for sub in ("bin", "binaries", "win64", "win32", "program files")):
+            score += 10
+        if size > 2 * 1024 * 1024:
+            score += 6
+        if size > 20 * 1024 * 1024:
+            score += 4
+        age_days = (time.time() - mtime) / (60 * 60 * 24)
+        if age_days < 30:
+            score += 3
+        elif age_days < 180:
+            score += 1
+
+        candidates.append({
+            "path": str(p),
+            "score": score,
+            "sim_name": round(sim_name, 3),
+            "sim_prod": round(sim_prod, 3),
+            "product_name": prod_name,
+            "file_version": file_version,
+            "size": size,
+            "mtime": mtime
+        })
 
     candidates.sort(key=lambda x: (x["score"], x["sim_prod"], x["sim_name"], x["mtime"]), reverse=True)
     return candidates[:top_n]
\ No newline at end of file
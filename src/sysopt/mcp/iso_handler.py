@@ -11,7 +11,8 @@ from shutil import which
 
 from contextlib import contextmanager
 
-from .bottles_handler import log_status, BOTTLES_CLI
+from . import bottles_handler
+from .bottles_handler import log_status
 
 # ------------------------------------------------------------------
 # ISO handling (7z only)
@@ -34,7 +35,11 @@ def mount_iso(iso_path: str, target_dir: Optional[Path] = None):
 
     try:
         log_status("system", f"[MCP] Extracting ISO with 7z: {iso_path} -> {target_dir}")
-        subprocess.run(["7z", "x", str(iso_path), f"-o{target_dir}"], check=True, capture_output=True)
+        # -mmt=on: multithreaded; -bd/-y: no progress output or prompts. Only stderr is kept (for the error)
+        subprocess.run(
+            ["7z", "x", str(iso_path), f"-o{target_dir}", "-mmt=on", "-bd", "-y"],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, close_fds=False
+        )
     except Exception as e:
         if use_temp:
             log_status("system", f"[MCP] 7z failed: {e}")
@@ -54,17 +59,28 @@ def mount_iso(iso_path: str, target_dir: Optional[Path] = None):
             shutil.rmtree(target_dir, ignore_errors=True)
 
 def run_setup_in_bottle(bottle_name: str, setup_path: Path):
-    cmd = BOTTLES_CLI + ["run", "--bottle", bottle_name, str(setup_path)]
+    cmd = [*bottles_handler.BOTTLES_CLI, "run", "--bottle", bottle_name, str(setup_path)]
     log_status(bottle_name, f"[MCP] Running installer via: {' '.join(cmd)}")
-    subprocess.run(cmd, check=False)
+    subprocess.run(cmd, check=False, close_fds=False)
+
+SETUP_EXE_NAMES = {"setup.exe", "install.exe", "autorun.exe", "start.exe"}
 
 def find_setup_exe_in_iso(mount_point: Path) -> Optional[Path]:
-    candidates = ["setup.exe", "install.exe", "autorun.exe", "start.exe"]
-    for root, dirs, files in os.walk(mount_point):
-        depth = len(Path(root).relative_to(mount_point).parts)
-        if depth > 1:
+    # Setup EXEs sit in the ISO root or one directory below; nothing deeper is read
+    subdirs = []
+    with os.scandir(mount_point) as it:
+        for entry in it:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif entry.name.lower() in SETUP_EXE_NAMES:
+                return Path(entry.path)
+    for subdir in subdirs:
+        try:
+            with os.scandir(subdir) as it:
+                for entry in it:
+                    if entry.name.lower() in SETUP_EXE_NAMES and entry.is_file():
+                        return Path(entry.path)
+        except OSError:
             continue
-        for f in files:
-            if f.lower() in candidates:
-                return Path(root) / f
     return None
\ No newline at end of file